@@ -1,5 +1,8 @@
 from __future__ import annotations
-from typing import Optional, Tuple, TYPE_CHECKING
+import math
+from typing import List, Optional, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+import tcod
 import color
 import exceptions
 if TYPE_CHECKING:
@@ -101,11 +104,17 @@ class TakeStairsAction(Action):
         """
         Take the stairs, if any exist at the entity's location.
         """
-        if (self.entity.x, self.entity.y) == self.engine.game_map.downstairs_location:
-            self.engine.game_world.generate_floor()
+        location = self.entity.x, self.entity.y
+        if location == self.engine.game_map.downstairs_location:
+            self.engine.game_world.descend()
             self.engine.message_log.add_message(
                 "You descend the staircase.", color.descend
             )
+        elif location == self.engine.game_map.upstairs_location:
+            self.engine.game_world.ascend()
+            self.engine.message_log.add_message(
+                "You ascend the staircase.", color.descend
+            )
         else:
             raise exceptions.Impossible("There are no stairs here.")
 
@@ -168,7 +177,7 @@ class MovementAction(ActionWithDirection):
         if not self.engine.game_map.in_bounds(dest_x, dest_y):
             # Destination is out of bounds.
             raise exceptions.Impossible("That way is blocked.")
-        if not self.engine.game_map.tiles["walkable"][dest_x, dest_y]:
+        if self.engine.game_map.tile_layout[dest_x, dest_y] != 0:
             # Destination is blocked by a tile.
             raise exceptions.Impossible("That way is blocked.")
         if self.engine.game_map.get_blocking_entity_at_location(dest_x, dest_y):
@@ -196,5 +205,147 @@ class DigAction(Action):
 
     def perform(self) -> None:
         self.engine.message_log.add_message(f"Tile dug at: {self.x}, {self.y}.")
-        self.engine.game_map.tile_layout[self.x, self.y] = 0
+        self.engine.game_map.dig(self.x, self.y)
+
+
+
+class MultiTurnAction(Action):
+    """An action which takes many turns, made of one ordinary action per turn.
+
+    The event handler asks for each turn's action with `next_action` and performs it through the
+    normal turn pipeline, without rendering in between. It stops when `next_action` returns None or
+    `interrupted` says something needs the player's attention.
+    """
+
+    max_turns = 1000  # A safety limit on the turns taken in one go.
 
+    def __init__(self, entity: Actor):
+        super().__init__(entity)
+        self.start_hp = entity.fighter.hp
+        self.start_message_revision = self.engine.message_log.revision
+
+    def next_action(self) -> Optional[Action]:
+        """Return the action for the coming turn, or None once this action is finished.
+
+        This method must be overridden by MultiTurnAction subclasses.
+        """
+        raise NotImplementedError()
+
+    def hostile_in_view(self) -> bool:
+        """Return True if any other living actor can be seen."""
+        return self.engine.game_map.nearest_visible_actor(
+            self.entity.x, self.entity.y, max_distance=math.inf, exclude=self.entity
+        ) is not None
+
+    def interrupted(self) -> bool:
+        """Return True if the last turn did something the player should see before going on."""
+        return (
+            not self.entity.is_alive
+            or self.entity.level.requires_level_up
+            or self.entity.fighter.hp < self.start_hp
+            or self.engine.message_log.revision != self.start_message_revision
+            or self.hostile_in_view()
+        )
+
+    def path_to_nearest(self, goals: np.ndarray) -> List[Tuple[int, int]]:
+        """Return the steps to the nearest tile marked in the `goals` array.
+
+        Returns an empty list if none of them can be reached.
+        """
+        game_map = self.engine.game_map
+        # Only explored tiles are known, so the path may only leave them for the goal itself.
+        cost = np.array((game_map.tile_layout == 0) & (game_map.explored.to_array() | goals), dtype=np.int8)
+        graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
+        pathfinder = tcod.path.Pathfinder(graph)
+        for x, y in np.argwhere(goals).tolist():
+            pathfinder.add_root((x, y))
+        # The path runs from the entity to the closest goal, without the entity's own tile.
+        return [(x, y) for x, y in pathfinder.path_from((self.entity.x, self.entity.y))[1:].tolist()]
+
+    def step_towards(self, path: List[Tuple[int, int]]) -> Optional[Action]:
+        """Return the movement onto the first tile of `path`, or None if the path is empty."""
+        if not path:
+            return None
+        dest_x, dest_y = path[0]
+        return MovementAction(self.entity, dest_x - self.entity.x, dest_y - self.entity.y)
+
+
+class AutoExploreAction(MultiTurnAction):
+    """Walk towards the nearest unexplored tile until the whole floor has been explored."""
+
+    def __init__(self, entity: Actor):
+        super().__init__(entity)
+        self.path: List[Tuple[int, int]] = []
+
+    def next_action(self) -> Optional[Action]:
+        game_map = self.engine.game_map
+        if self.hostile_in_view():
+            raise exceptions.Impossible("You can't explore with enemies in view.")
+        # Keep following the current path while the tile at its end is still unexplored.
+        if not self.path or game_map.explored[self.path[-1]]:
+            frontier = game_map.explorable.to_array() & ~game_map.explored.to_array() & (game_map.tile_layout == 0)
+            if not frontier.any():
+                raise exceptions.Impossible("There is nothing left to explore.")
+            self.path = self.path_to_nearest(frontier)
+            if not self.path:
+                raise exceptions.Impossible("There is nothing left to explore that you can reach.")
+        action = self.step_towards(self.path)
+        self.path = self.path[1:]
+        return action
+
+
+class TravelAction(MultiTurnAction):
+    """Walk to an explored tile over the shortest known path."""
+
+    def __init__(self, entity: Actor, dest_x: int, dest_y: int):
+        super().__init__(entity)
+        self.dest_x = dest_x
+        self.dest_y = dest_y
+        self.path: Optional[List[Tuple[int, int]]] = None
+
+    def next_action(self) -> Optional[Action]:
+        if self.path is None:
+            game_map = self.engine.game_map
+            if not game_map.in_bounds(self.dest_x, self.dest_y) or not game_map.explored[self.dest_x, self.dest_y]:
+                raise exceptions.Impossible("You don't know the way there.")
+            if self.hostile_in_view():
+                raise exceptions.Impossible("You can't travel with enemies in view.")
+            goal = np.zeros((game_map.width, game_map.height), dtype=bool, order="F")
+            goal[self.dest_x, self.dest_y] = True
+            self.path = self.path_to_nearest(goal)
+            if not self.path and (self.entity.x, self.entity.y) != (self.dest_x, self.dest_y):
+                raise exceptions.Impossible("You don't know the way there.")
+        action = self.step_towards(self.path)
+        self.path = self.path[1:]
+        return action
+
+
+class RestAction(MultiTurnAction):
+    """Wait in place until something interrupts, or for a number of turns."""
+
+    def __init__(self, entity: Actor, turns: int = 100):
+        super().__init__(entity)
+        self.turns_left = turns
+
+    def next_action(self) -> Optional[Action]:
+        if self.turns_left <= 0:
+            return None
+        if self.hostile_in_view():
+            raise exceptions.Impossible("You can't rest with enemies in view.")
+        self.turns_left -= 1
+        return WaitAction(self.entity)
+
+
+class RepeatAction(MultiTurnAction):
+    """Perform the same single-turn action a number of times, such as a step or a wait."""
+
+    def __init__(self, entity: Actor, action: Action, count: int):
+        super().__init__(entity)
+        self.action = action
+        self.count_left = count
+
+    def next_action(self) -> Optional[Action]:
+        if self.count_left <= 0:
+            return None
+        self.count_left -= 1
+        return self.action
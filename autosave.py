@@ -0,0 +1,82 @@
+"""Periodic saves which compress and write in the background, so that the game never waits on them."""
+from __future__ import annotations
+
+import concurrent.futures
+import time
+from typing import Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+AUTOSAVE_TURNS = 100  # Turns between autosaves.
+
+
+class Autosaver:
+    """Saves a game to its save slot every `interval` turns.
+
+    Only the snapshot of the game's state, or of its changes since the last save, is taken on the
+    main thread. Compressing it and writing it out happens on a worker thread, while the game goes
+    on. zlib releases the GIL while it compresses, so the worker barely competes with the game.
+    """
+
+    def __init__(self, interval: int = AUTOSAVE_TURNS):
+        self.interval = interval
+        self.engine: Optional[Engine] = None  # The game being autosaved.
+        self.last_turn = 0  # The turn of the last save, or of when the game was started or loaded.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+        self.pending: Optional[concurrent.futures.Future] = None
+        # Totals for the summary printed on exit.
+        self.saves = 0
+        self.snapshot_time = 0.0  # Time the main thread spent taking snapshots.
+        self.write_time = 0.0  # Time the worker spent compressing and writing.
+
+    def update(self, engine: Engine) -> None:
+        """Start an autosave if enough turns have passed since the last one."""
+        if not engine.player.is_alive:
+            # Let any save of the game in progress land, before the game over screen deletes it.
+            self.wait()
+            return
+        if engine is not self.engine:
+            self.engine = engine  # A game was started or loaded, count the turns from now.
+            self.last_turn = engine.turn_count
+        if engine.turn_count - self.last_turn < self.interval:
+            return
+        if self.pending is not None and not self.pending.done():
+            return  # The last autosave is still being written, try again after the next turn.
+        self.start(engine)
+
+    def start(self, engine: Engine) -> None:
+        """Snapshot `engine` now, then save the snapshot in the background."""
+        start = time.perf_counter()
+        write = engine.save_journal.prepare(engine, engine.save_path)
+        self.snapshot_time += time.perf_counter() - start
+        self.last_turn = engine.turn_count
+        self.saves += 1
+        self.pending = self.executor.submit(self._write, write)
+
+    def _write(self, write: Callable[[], None]) -> None:
+        start = time.perf_counter()
+        write()
+        self.write_time += time.perf_counter() - start
+
+    def wait(self) -> None:
+        """Block until the autosave being written, if any, is on disk.
+
+        Raises the error the autosave failed with, if it did. It's only raised once.
+        """
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            pending.result()
+
+    def close(self) -> None:
+        """Finish any autosave in progress and stop the worker thread."""
+        self.wait()
+        self.executor.shutdown()
+
+    def summary(self) -> str:
+        if not self.saves:
+            return "No autosaves."
+        return (
+            f"Autosaved {self.saves} times: {self.snapshot_time / self.saves * 1000:.2f} ms on the"
+            f" main thread and {self.write_time / self.saves * 1000:.2f} ms in the background per save."
+        )
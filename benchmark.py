@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""Headless benchmarks for the parts of the game which run every frame or every turn.
+
+Usage: python benchmark.py {autosave,floors,journal,load,masks,render,save,stairs,turns}
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+import tcod
+
+import setup_game
+
+
+def new_benchmark_game(map_width: int = 80, map_height: int = 43):
+    """Return a new game on a freshly generated floor of the given size."""
+    random.seed(0)
+    engine = setup_game.new_game()
+    engine.game_world.map_width = map_width
+    engine.game_world.map_height = map_height
+    engine.game_world.max_rooms = max(30, map_width * map_height // 100)
+    engine.game_world.current_floor -= 1
+    engine.game_world.generate_floor()
+    engine.update_fov()
+    return engine
+
+
+def bench_render(args: argparse.Namespace) -> None:
+    """Measure the time and the bytes allocated to render one frame of the map."""
+    engine = new_benchmark_game(args.width, args.height)
+    console = tcod.Console(80, 50, order="F")
+    engine.render(console)  # Warm up, so that the glyph and text caches are filled.
+
+    tracemalloc.start()
+    start_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    engine.game_map.render(console, engine.camera)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        engine.game_map.render(console, engine.camera)
+    elapsed = time.perf_counter() - start
+
+    print(f"map {args.width}x{args.height}")
+    print(f"GameMap.render: {elapsed / args.frames * 1000:.3f} ms/frame")
+    print(f"GameMap.render: {peak - start_size} bytes allocated/frame (peak)")
+
+
+def bench_turns(args: argparse.Namespace) -> None:
+    """Measure how many turns per second resting runs through the normal action pipeline."""
+    import actions
+    import input_handlers
+
+    engine = new_benchmark_game(args.width, args.height)
+    handler = input_handlers.MainGameEventHandler(engine)
+
+    turns = 0
+    start = time.perf_counter()
+    while turns < args.turns:
+        before = engine.turn_count
+        rest = actions.RestAction(engine.player, turns=min(args.turns - turns, actions.RestAction.max_turns))
+        if not handler.handle_multi_turn_action(rest):
+            break
+        turns += engine.turn_count - before
+    elapsed = time.perf_counter() - start
+
+    print(f"map {args.width}x{args.height}")
+    print(f"RestAction: {turns} turns in {elapsed * 1000:.1f} ms, {turns / elapsed:.0f} turns/s")
+
+
+def populate(engine, entities: int, messages: int) -> None:
+    """Scatter monsters and items over the floor and fill the message log, as a long game would."""
+    import entity_factories
+
+    game_map = engine.game_map
+    prototypes = [
+        entity_factories.orc,
+        entity_factories.troll,
+        entity_factories.health_potion,
+        entity_factories.fireball_scroll,
+        entity_factories.sword,
+    ]
+    floor = [(int(x), int(y)) for x, y in zip(*(game_map.tile_layout == 0).nonzero())]
+    for _ in range(entities):
+        random.choice(prototypes).spawn(game_map, *random.choice(floor))
+    for i in range(messages):
+        engine.message_log.add_message(f"Message number {i}.")
+
+
+def bench_save(args: argparse.Namespace) -> None:
+    """Compare saving and loading in the binary save format with the old pickled Engine."""
+    import lzma
+    import pickle
+
+    import savefile
+
+    engine = new_benchmark_game(args.width, args.height)
+    populate(engine, args.entities, messages=1000)
+
+    def load_everything(data: bytes):
+        loaded = savefile.load_engine(data)
+        loaded.message_log.hydrate()  # Wait for the messages left to the worker thread too.
+        return loaded
+
+    formats = {
+        "pickle+lzma": (
+            lambda: lzma.compress(pickle.dumps(engine)),
+            lambda data: pickle.loads(lzma.decompress(data)),
+        ),
+        "savefile": (lambda: savefile.save_engine(engine), savefile.load_engine),
+        "savefile, hydrated": (lambda: savefile.save_engine(engine), load_everything),
+    }
+    print(f"map {args.width}x{args.height}, {len(engine.game_map.entities)} entities")
+    for name, (save, load) in formats.items():
+        start = time.perf_counter()
+        for _ in range(args.saves):
+            data = save()
+        save_time = (time.perf_counter() - start) / args.saves
+        start = time.perf_counter()
+        for _ in range(args.saves):
+            load(data)
+        load_time = (time.perf_counter() - start) / args.saves
+        print(
+            f"{name:>18}: save {save_time * 1000:7.2f} ms, load {load_time * 1000:7.2f} ms,"
+            f" {len(data):8} bytes"
+        )
+
+
+def bench_autosave(args: argparse.Namespace) -> None:
+    """Measure how much background autosaves slow down the turns they happen on."""
+    import os
+    import tempfile
+
+    import actions
+    import autosave
+    import input_handlers
+
+    engine = new_benchmark_game(args.width, args.height)
+    populate(engine, args.entities, messages=500)
+    engine.player.fighter.max_hp = engine.player.fighter.hp = 10 ** 6  # Outlive the monsters.
+    handler = input_handlers.MainGameEventHandler(engine)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for interval in (0, args.autosave_turns):
+            engine.save_path = os.path.join(directory, "bench.sav")
+            autosaver = autosave.Autosaver(interval=interval)
+            turn_times = []
+            for _ in range(args.turns):
+                start = time.perf_counter()
+                handler.handle_action(actions.WaitAction(engine.player))
+                if interval:
+                    autosaver.update(engine)
+                turn_times.append(time.perf_counter() - start)
+            autosaver.close()
+            label = f"autosave every {interval} turns" if interval else "no autosave"
+            print(
+                f"{label:>26}: {sum(turn_times) / len(turn_times) * 1000:.3f} ms/turn mean,"
+                f" {max(turn_times) * 1000:.3f} ms worst"
+            )
+            if interval:
+                print(autosaver.summary())
+
+
+def bench_journal(args: argparse.Namespace) -> None:
+    """Compare saving every few turns to a journal with writing a full save every time."""
+    import os
+    import tempfile
+
+    import actions
+    import input_handlers
+    import save_journal
+    import setup_game
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, compact_ratio in (("full saves", -1.0), ("journal", save_journal.COMPACT_RATIO)):
+            engine = new_benchmark_game(args.width, args.height)
+            populate(engine, args.entities, messages=500)
+            engine.player.fighter.max_hp = engine.player.fighter.hp = 10 ** 6  # Outlive the monsters.
+            engine.save_journal = save_journal.SaveJournal(compact_ratio)  # A negative ratio compacts every save.
+            handler = input_handlers.MainGameEventHandler(engine)
+            filename = os.path.join(directory, f"{label}.sav")
+
+            save_times = []
+            written = 0
+            for turn in range(1, args.turns + 1):
+                handler.handle_action(actions.WaitAction(engine.player))
+                if turn % args.autosave_turns == 0:
+                    end = engine.save_journal.end
+                    start = time.perf_counter()
+                    engine.save_as(filename)
+                    save_times.append(time.perf_counter() - start)
+                    journal = engine.save_journal
+                    # A checkpoint rewrites the whole file, a record only adds to it.
+                    written += journal.end if journal.end == journal.checkpoint_size else journal.end - end
+            start = time.perf_counter()
+            setup_game.load_game(filename)
+            load_time = time.perf_counter() - start
+            print(
+                f"{label:>10}: {len(save_times)} saves, {sum(save_times) / len(save_times) * 1000:.2f} ms"
+                f" and {written // len(save_times)} bytes written per save, load {load_time * 1000:.2f} ms"
+            )
+
+
+def bench_masks(args: argparse.Namespace) -> None:
+    """Compare the bool layers of a floor held as bool arrays and as packed bits."""
+    import numpy as np
+
+    from map_chunks import BitMask
+
+    engine = new_benchmark_game(args.width, args.height)
+    game_map = engine.game_map
+    explored = game_map.explored.to_array()
+    packed = BitMask.from_array(explored)
+    print(
+        f"map {args.width}x{args.height}: {explored.nbytes} bytes per bool layer,"
+        f" {packed.bits.nbytes} bytes packed"
+    )
+
+    earlier = explored.copy(order="F")
+    earlier_packed = BitMask.from_array(earlier)
+    game_map.explored[game_map.fov_area] = True  # A change the size of one field of view.
+    now = game_map.explored.to_array()
+    now_packed = BitMask.from_array(now)
+    timings = {
+        "pack": lambda: BitMask.from_array(now),
+        "unpack": now_packed.to_array,
+        "diff (bool)": lambda: np.flatnonzero((now != earlier).ravel(order="F")),
+        "diff (packed)": lambda: (now_packed ^ earlier_packed).flatnonzero(),
+    }
+    for name, function in timings.items():
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            function()
+        print(f"{name:>14}: {(time.perf_counter() - start) / args.frames * 1000:.3f} ms")
+
+
+def bench_floors(args: argparse.Namespace) -> None:
+    """Measure floor switches and the memory taken by the visited floors, going down and back up."""
+    import actions
+
+    engine = new_benchmark_game(args.width, args.height)
+    floors = engine.game_world.floors
+    floors.hot_radius = args.hot_floors
+    floors.memory_budget = args.floor_budget * 1024
+
+    def take_stairs(location) -> None:
+        engine.player.place(*location, engine.game_map)
+        actions.TakeStairsAction(engine.player).perform()
+        engine.update_fov()
+
+    for _ in range(args.floors - 1):
+        populate(engine, args.entities, messages=0)
+        take_stairs(engine.game_map.downstairs_location)
+    populate(engine, args.entities, messages=0)
+    while engine.game_world.current_floor > 1:
+        take_stairs(engine.game_map.upstairs_location)
+    while engine.game_world.current_floor < args.floors:
+        take_stairs(engine.game_map.downstairs_location)
+
+    print(
+        f"{args.floors} floors of {args.width}x{args.height} with {args.entities} entities each,"
+        f" {args.hot_floors} hot floor(s) either side, {args.floor_budget} KiB packed floor budget"
+    )
+    print(floors.summary())
+    try:
+        import resource
+    except ImportError:  # Not on Windows.
+        return
+    print(f"Peak resident set size of the process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} KiB")
+
+
+def bench_stairs(args: argparse.Namespace) -> None:
+    """Measure going down to new floors, with and without their layouts generated ahead of time."""
+    import actions
+
+    for prefetch in (False, True):
+        engine = new_benchmark_game(args.width, args.height)
+        game_world = engine.game_world
+        if not prefetch:
+            game_world.prefetch = None
+            game_world.prefetch_next_floor = lambda: None  # type: ignore
+        times = []
+        for _ in range(args.floors):
+            time.sleep(args.explore_time)  # The player exploring the floor, while the next one is generated.
+            engine.player.place(*engine.game_map.downstairs_location, engine.game_map)
+            start = time.perf_counter()
+            actions.TakeStairsAction(engine.player).perform()
+            engine.update_fov()
+            times.append(time.perf_counter() - start)
+        kinds = ", ".join(f"{kind} {len(switches)}" for kind, switches in sorted(game_world.floors.switch_times.items()))
+        print(
+            f"{'prefetched' if prefetch else 'synchronous'}: {args.floors} descents to {args.width}x{args.height}"
+            f" floors ({kinds}), {sum(times) / len(times) * 1000:.2f} ms mean, {max(times) * 1000:.2f} ms worst"
+        )
+
+
+def bench_load(args: argparse.Namespace) -> None:
+    """Measure loading a saved world of several big floors from disk, and the memory it peaks at."""
+    import os
+    import tempfile
+
+    import actions
+
+    engine = new_benchmark_game(args.width, args.height)
+    for _ in range(args.floors - 1):
+        populate(engine, args.entities, messages=100)
+        engine.player.place(*engine.game_map.downstairs_location, engine.game_map)
+        actions.TakeStairsAction(engine.player).perform()
+    populate(engine, args.entities, messages=1000)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "load.sav")
+        engine.save_as(filename)
+        setup_game.load_game(filename)  # Warm up the imports and prototype caches.
+        start = time.perf_counter()
+        for _ in range(args.saves):
+            setup_game.load_game(filename)
+        load_time = (time.perf_counter() - start) / args.saves
+        tracemalloc.start()
+        setup_game.load_game(filename)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{args.floors} floors of {args.width}x{args.height}, {os.path.getsize(filename)} bytes:"
+            f" load {load_time * 1000:.2f} ms, {peak // 1024} KiB peak traced memory"
+        )
+
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], None]] = {
+    "render": bench_render,
+    "turns": bench_turns,
+    "save": bench_save,
+    "autosave": bench_autosave,
+    "floors": bench_floors,
+    "journal": bench_journal,
+    "load": bench_load,
+    "masks": bench_masks,
+    "stairs": bench_stairs,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--width", type=int, default=80, help="map width in tiles")
+    parser.add_argument("--height", type=int, default=43, help="map height in tiles")
+    parser.add_argument("--frames", type=int, default=200, help="frames to render")
+    parser.add_argument("--turns", type=int, default=10000, help="turns to simulate")
+    parser.add_argument("--entities", type=int, default=200, help="extra entities to place on the map")
+    parser.add_argument("--saves", type=int, default=10, help="times to save and load")
+    parser.add_argument("--autosave-turns", type=int, default=100, help="turns between autosaves")
+    parser.add_argument("--floors", type=int, default=20, help="floors to go down")
+    parser.add_argument("--hot-floors", type=int, default=1, help="floors either side of the current one kept live")
+    parser.add_argument("--floor-budget", type=int, default=4096, help="KiB of packed floors kept in memory")
+    parser.add_argument("--explore-time", type=float, default=0.5, help="seconds spent on each floor before descending")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from typing import Tuple
+
+
+class Camera:
+    """The window of the map which is drawn to the screen.
+
+    The camera follows the player, but stops at the edges of the map so that no space is wasted.
+    Maps smaller than the camera are drawn from the top left corner of the screen.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width, self.height = width, height  # Size of the viewport, in tiles.
+        self.x, self.y = 0, 0  # Map position of the top left tile of the viewport.
+        self.map_width, self.map_height = width, height
+
+    def center_on(self, x: int, y: int, map_width: int, map_height: int) -> None:
+        """Move the camera so that (x, y) is as close to the middle of the viewport as the map allows."""
+        self.map_width, self.map_height = map_width, map_height
+        self.x = max(0, min(x - self.width // 2, map_width - self.width))
+        self.y = max(0, min(y - self.height // 2, map_height - self.height))
+
+    @property
+    def window(self) -> Tuple[slice, slice]:
+        """Return the part of the map inside the viewport as a 2D array index."""
+        return (
+            slice(self.x, min(self.x + self.width, self.map_width)),
+            slice(self.y, min(self.y + self.height, self.map_height)),
+        )
+
+    def map_to_screen(self, x: int, y: int) -> Tuple[int, int]:
+        return x - self.x, y - self.y
+
+    def screen_to_map(self, x: int, y: int) -> Tuple[int, int]:
+        return x + self.x, y + self.y
+
+    def in_view(self, x: int, y: int) -> bool:
+        """Return True if map position (x, y) is inside the viewport."""
+        window_x, window_y = self.window
+        return window_x.start <= x < window_x.stop and window_y.start <= y < window_y.stop
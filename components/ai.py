@@ -4,6 +4,7 @@ import numpy as np  # type: ignore
 import tcod
 import random
 from actions import Action, BumpAction, MeleeAction, MovementAction, WaitAction
+from map_chunks import CHUNK_SIZE, area_of_interest
 if TYPE_CHECKING:
     from entity import Actor
 
@@ -16,31 +17,49 @@ class BaseAI(Action):
     def get_path_to(self, dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
         """Compute and return a path to the target position.
 
+        The search is limited to the map chunks around the start and destination, and only
+        falls back to the whole map when no path exists within them.
         If there is no valid path then returns an empty list.
         """
-        # Copy the walkable array.
-        cost = np.array(self.entity.parent.tiles["walkable"], dtype=np.int8)
+        game_map = self.entity.parent
+        shape = (game_map.width, game_map.height)
+        area = area_of_interest(shape, self.entity.x, self.entity.y, dest_x, dest_y, margin=CHUNK_SIZE)
+        path = self._path_within(area, dest_x, dest_y)
+        if not path and area != (slice(0, shape[0]), slice(0, shape[1])):
+            path = self._path_within((slice(0, shape[0]), slice(0, shape[1])), dest_x, dest_y)
+        return path
+
+    def _path_within(self, area: Tuple[slice, slice], dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
+        """Compute a path to the target position which stays inside `area` of the map."""
+        area_x, area_y = area
+        left, top = area_x.start, area_y.start
+
+        # Floor tiles are the walkable ones.
+        cost = np.array(self.entity.parent.tile_layout[area] == 0, dtype=np.int8)
 
         for entity in self.entity.parent.entities:
+            x, y = entity.x - left, entity.y - top
+            if not (0 <= x < cost.shape[0] and 0 <= y < cost.shape[1]):
+                continue
             # Check that an enitiy blocks movement and the cost isn't zero (blocking.)
-            if entity.blocks_movement and cost[entity.x, entity.y]:
+            if entity.blocks_movement and cost[x, y]:
                 # Add to the cost of a blocked position.
                 # A lower number means more enemies will crowd behind each other in
                 # hallways.  A higher number means enemies will take longer paths in
                 # order to surround the player.
-                cost[entity.x, entity.y] += 10
+                cost[x, y] += 10
 
         # Create a graph from the cost array and pass that graph to a new pathfinder.
         graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
         pathfinder = tcod.path.Pathfinder(graph)
 
-        pathfinder.add_root((self.entity.x, self.entity.y))  # Start position.
+        pathfinder.add_root((self.entity.x - left, self.entity.y - top))  # Start position.
 
         # Compute the path to the destination and remove the starting point.
-        path: List[List[int]] = pathfinder.path_to((dest_x, dest_y))[1:].tolist()
+        path: List[List[int]] = pathfinder.path_to((dest_x - left, dest_y - top))[1:].tolist()
 
-        # Convert from List[List[int]] to List[Tuple[int, int]].
-        return [(index[0], index[1]) for index in path]
+        # Convert from List[List[int]] to List[Tuple[int, int]], in map coordinates.
+        return [(index[0] + left, index[1] + top) for index in path]
 
 
 class ConfusedEnemy(BaseAI):
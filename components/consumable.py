@@ -83,17 +83,15 @@ class FireballDamageConsumable(Consumable):
         if not self.engine.game_map.visible[target_xy]:
             raise Impossible("You cannot target an area that you cannot see.")
 
-        targets_hit = False
-        for actor in self.engine.game_map.actors:
-            if actor.distance(*target_xy) <= self.radius:
-                randomized_damage = random.randint(self.damage - 3, self.damage + 3)
-                self.engine.message_log.add_message(
-                    f"The {actor.name} is engulfed in a fiery explosion, taking {randomized_damage} damage!"
-                )
-                actor.fighter.take_damage(randomized_damage)
-                targets_hit = True
-
-        if not targets_hit:
+        targets = self.engine.game_map.actors_within(*target_xy, self.radius)
+        for actor in targets:
+            randomized_damage = random.randint(self.damage - 3, self.damage + 3)
+            self.engine.message_log.add_message(
+                f"The {actor.name} is engulfed in a fiery explosion, taking {randomized_damage} damage!"
+            )
+            actor.fighter.take_damage(randomized_damage)
+
+        if not targets:
             raise Impossible("There are no targets in the radius.")
         self.consume()
 
@@ -105,16 +103,9 @@ class LightningDamageConsumable(Consumable):
 
     def activate(self, action: actions.ItemAction) -> None:
         consumer = action.entity
-        target = None
-        closest_distance = self.maximum_range + 1.0
-
-        for actor in self.engine.game_map.actors:
-            if actor is not consumer and self.parent.gamemap.visible[actor.x, actor.y]:
-                distance = consumer.distance(actor.x, actor.y)
-
-                if distance < closest_distance:
-                    target = actor
-                    closest_distance = distance
+        target = self.engine.game_map.nearest_visible_actor(
+            consumer.x, consumer.y, max_distance=self.maximum_range + 1.0, exclude=consumer
+        )
 
         if target:
             self.engine.message_log.add_message(
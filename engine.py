@@ -2,17 +2,19 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 from tcod.console import Console
 from tcod.map import compute_fov
+from camera import Camera
+from map_chunks import area_of_interest
 from message_log import MessageLog
+from save_journal import SaveJournal
 import exceptions
 import render_functions
-import lzma
-import pickle
-import numpy as np
 
 if TYPE_CHECKING:
     from entity import Actor
     from game_map import GameMap, GameWorld
 
+FOV_RADIUS = 8
+
 
 class Engine:
     game_map: GameMap
@@ -20,9 +22,21 @@ class Engine:
 
     def __init__(self, player: Actor):
         self.message_log = MessageLog()
-        self.mouse_location = (0, 0)
+        self.mouse_location = (0, 0)  # Map position under the mouse cursor.
+        self.camera = Camera(width=80, height=43)
+        self.turn_count = 0  # Turns completed so far. Entities only move, appear or change between turns.
+        self.save_path = "savegame.sav"  # The save slot this game is saved to.
+        self.save_journal = SaveJournal()  # What was saved last, so later saves only append the changes.
         self.player = player
 
+    def __setstate__(self, state: dict) -> None:
+        # Engines pickled by older versions of the game lack the attributes added since.
+        self.camera = Camera(width=80, height=43)
+        self.turn_count = 0
+        self.save_path = "savegame.sav"
+        self.save_journal = SaveJournal()
+        self.__dict__.update(state)
+
     def handle_enemy_turns(self) -> None:
         for entity in set(self.game_map.actors) - {self.player}:
             if entity.ai:
@@ -32,23 +46,31 @@ class Engine:
                     pass  # Ignore impossible action exceptions from AI.
 
     def update_fov(self) -> None:
-        """Recompute the visible area based on the players point of view."""
-        transparent_array = np.full((self.game_map.width, self.game_map.height), fill_value=False, order="F")
-        if self.game_map.tile_layout is not None:
-            for (x, y), t in np.ndenumerate(self.game_map.tile_layout):
-                if t == 0:
-                    transparent_array[x, y] = True
-
-        self.game_map.visible[:] = compute_fov(
-            transparent_array,  # used to be: self.game_map.tiles["transparent"]
-            (self.player.x, self.player.y),
-            radius=8,
+        """Recompute the visible area based on the players point of view.
+
+        Only the map chunks within the light radius of the player are recomputed.
+        """
+        game_map = self.game_map
+        area = area_of_interest(
+            (game_map.width, game_map.height),
+            self.player.x, self.player.y, self.player.x, self.player.y,
+            margin=FOV_RADIUS,
         )
+        area_x, area_y = area
+
+        game_map.visible[game_map.fov_area] = False
+        game_map.visible[area] = compute_fov(
+            game_map.tile_layout[area] == 0,  # used to be: self.game_map.tiles["transparent"]
+            (self.player.x - area_x.start, self.player.y - area_y.start),
+            radius=FOV_RADIUS,
+        )
+        game_map.fov_area = area
         # If a tile is "visible" it should be added to "explored".
-        self.game_map.explored |= self.game_map.visible
+        game_map.explored.set_where(area, game_map.visible[area], True)
 
     def render(self, console: Console) -> None:
-        self.game_map.render(console)
+        self.camera.center_on(self.player.x, self.player.y, self.game_map.width, self.game_map.height)
+        self.game_map.render(console, self.camera)
 
         self.message_log.render(console=console, x=21, y=45, width=40, height=5)
 
@@ -70,7 +92,8 @@ class Engine:
         )
 
     def save_as(self, filename: str) -> None:
-        """Save this Engine instance as a compressed file."""
-        save_data = lzma.compress(pickle.dumps(self))
-        with open(filename, "wb") as f:
-            f.write(save_data)
+        """Save this Engine instance in the binary save format of savefile.
+
+        Saving again to the same file only appends the changes since the last save to its journal.
+        """
+        self.save_journal.prepare(self, filename)()
@@ -22,6 +22,7 @@ class Entity:
     A generic object to represent players, enemies, items, etc.
     """
     parent: Union[GameMap, Inventory]
+    prototype_id: Optional[str] = None  # Name of the entity_factories prototype this was copied from.
 
     def __init__(
             self,
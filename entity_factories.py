@@ -4,7 +4,7 @@ from components.equipment import Equipment
 from components.fighter import Fighter
 from components.inventory import Inventory
 from components.level import Level
-from entity import Actor, Item
+from entity import Actor, Entity, Item
 
 player = Actor(
     char="@",
@@ -95,3 +95,8 @@ leather_armor = Item(
 chain_mail = Item(
     char="[", color=(139, 69, 19), name="Chain Mail", equippable=equippable.ChainMail()
 )
+
+# Every prototype above, by the name it's defined with. Saves refer to entities by these names.
+PROTOTYPES = {name: value for name, value in list(globals().items()) if isinstance(value, Entity)}
+for prototype_id, prototype in PROTOTYPES.items():
+    prototype.prototype_id = prototype_id  # Kept by the copies made with spawn and deepcopy.
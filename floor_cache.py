@@ -0,0 +1,189 @@
+"""The floors of a GameWorld which the player isn't on, kept for when they come back.
+
+A floor only changes while the player is on it, so a floor which has been left stays as it was.
+The floors next to the current one are kept as live GameMaps, so that taking the stairs to them is
+instant. Floors further away are packed into the compressed floor format of savefile, and once
+the packed floors held in memory pass the memory budget, the least recently visited ones are
+spilled to a temporary file. Packed floors are unpacked again when they are visited.
+"""
+from __future__ import annotations
+
+import collections
+import tempfile
+import time
+from typing import BinaryIO, Dict, List, Optional, OrderedDict, Tuple, TYPE_CHECKING
+
+import savefile
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from game_map import GameMap
+
+HOT_RADIUS = 1  # Floors this close to the current one are kept live.
+MEMORY_BUDGET = 4 * 1024 * 1024  # Bytes of packed floors held in memory before spilling to disk.
+
+ENTITY_BYTES = 2500  # Rough memory taken by a live entity and its components.
+
+
+def live_floor_bytes(game_map: GameMap) -> int:
+    """Return an estimate of the memory taken by a live floor: its layers and its entities."""
+    layers = (game_map.tile_layout, game_map.tiles, game_map.visible, game_map.explored, game_map.explorable)
+    return sum(layer.nbytes for layer in layers) + ENTITY_BYTES * len(game_map.entities)
+
+
+class FloorEntry:
+    """A floor in the cache, held in one or more forms."""
+
+    def __init__(self, game_map: Optional[GameMap] = None, packed: Optional[bytes] = None):
+        self.game_map = game_map  # The live floor, while the floor is hot.
+        self.packed = packed  # The floor in the compressed floor format, once it has been packed.
+        self.spilled: Optional[Tuple[int, int]] = None  # (offset, length) of the packed floor in the spill file.
+
+    @property
+    def state(self) -> str:
+        if self.game_map is not None:
+            return "live"
+        return "packed" if self.packed is not None else "spilled"
+
+
+class FloorCache:
+    """The floors a GameWorld isn't on, by floor number, least recently visited first."""
+
+    def __init__(self, engine: Engine, hot_radius: int = HOT_RADIUS, memory_budget: int = MEMORY_BUDGET):
+        self.engine = engine
+        self.hot_radius = hot_radius
+        self.memory_budget = memory_budget
+        self.entries: OrderedDict[int, FloorEntry] = collections.OrderedDict()
+        self.spill_file: Optional[BinaryIO] = None  # Append-only, created on the first spill.
+        self.spill_size = 0
+        # Floor switch times by how the floor switched to was held, for the summary.
+        self.switch_times: Dict[str, List[float]] = collections.defaultdict(list)
+
+    def __getstate__(self) -> dict:
+        """Pickle the spilled floors from memory, the spill file is only open for this session."""
+        state = self.__dict__.copy()
+        state["entries"] = collections.OrderedDict(
+            (floor, FloorEntry(entry.game_map, self.packed(floor))) for floor, entry in self.entries.items()
+        )
+        state["spill_file"] = None
+        state["spill_size"] = 0
+        return state
+
+    def __contains__(self, floor: int) -> bool:
+        return floor in self.entries
+
+    def floors(self) -> List[int]:
+        return sorted(self.entries)
+
+    def state(self, floor: int) -> str:
+        """Return how `floor` is held: "live", "packed" in memory, or "spilled" to disk."""
+        return self.entries[floor].state
+
+    def store(self, floor: int, game_map: GameMap) -> None:
+        """Keep the live `game_map` of `floor`, which the player is leaving."""
+        self.entries[floor] = FloorEntry(game_map)
+        self.entries.move_to_end(floor)
+
+    def add_packed(self, floor: int, packed: bytes) -> None:
+        """Keep `floor` in the compressed floor format, as it was loaded from a save."""
+        self.entries[floor] = FloorEntry(packed=packed)
+        self.entries.move_to_end(floor)
+
+    def discard(self, floor: int) -> None:
+        self.entries.pop(floor, None)
+
+    def take(self, floor: int) -> GameMap:
+        """Remove `floor` from the cache and return it live, for the player to go to."""
+        entry = self.entries[floor]
+        game_map = entry.game_map
+        if game_map is None:
+            game_map = savefile.unpack_floor(self.packed_entry(entry), self.engine)  # Kept if this raises.
+        del self.entries[floor]
+        return game_map
+
+    def packed(self, floor: int) -> bytes:
+        """Return `floor` in the compressed floor format, packing it if it's only held live."""
+        return self.packed_entry(self.entries[floor])
+
+    def snapshot(self, floor: int) -> savefile.Section:
+        """Return `floor` in the compressed floor format, or if it's only held live, a function packing it as it is now."""
+        entry = self.entries[floor]
+        if entry.game_map is not None and entry.packed is None and entry.spilled is None:
+            return savefile.snapshot_floor(entry.game_map, self.engine)
+        return self.packed_entry(entry)
+
+    def packed_entry(self, entry: FloorEntry) -> bytes:
+        if entry.packed is not None:
+            return entry.packed
+        if entry.spilled is not None:
+            assert self.spill_file is not None
+            offset, length = entry.spilled
+            self.spill_file.seek(offset)
+            return self.spill_file.read(length)
+        assert entry.game_map is not None
+        # Left floors never change, so the packed floor stays valid for as long as it's cached.
+        entry.packed = savefile.pack_floor(entry.game_map, self.engine)
+        return entry.packed
+
+    def settle(self, current_floor: int) -> None:
+        """Make the floors near `current_floor` live and pack the rest, then spill down to the memory budget."""
+        for floor, entry in self.entries.items():
+            near = abs(floor - current_floor) <= self.hot_radius
+            if near and entry.game_map is None:
+                entry.game_map = savefile.unpack_floor(self.packed_entry(entry), self.engine)
+            elif not near and entry.game_map is not None:
+                self.packed_entry(entry)
+                entry.game_map = None
+
+        packed_bytes = self.memory()["packed"]
+        for entry in self.entries.values():  # Least recently visited first.
+            if packed_bytes <= self.memory_budget:
+                break
+            if entry.game_map is None and entry.packed is not None:
+                packed_bytes -= len(entry.packed)
+                self.spill(entry)
+
+    def spill(self, entry: FloorEntry) -> None:
+        """Move the packed floor of `entry` to the spill file."""
+        assert entry.packed is not None
+        if entry.spilled is None:
+            if self.spill_file is None:
+                self.spill_file = tempfile.TemporaryFile(prefix="floors")
+            self.spill_file.seek(self.spill_size)
+            self.spill_file.write(entry.packed)
+            entry.spilled = self.spill_size, len(entry.packed)
+            self.spill_size += len(entry.packed)
+        entry.packed = None
+
+    def memory(self) -> Dict[str, int]:
+        """Return the bytes taken by the cached floors, by how they're held.
+
+        "live" is an estimate, see live_floor_bytes. Packed floors which are also live are counted
+        in "packed" too.
+        """
+        memory = {"live": 0, "packed": 0, "spilled": self.spill_size}
+        for entry in self.entries.values():
+            if entry.game_map is not None:
+                memory["live"] += live_floor_bytes(entry.game_map)
+            if entry.packed is not None:
+                memory["packed"] += len(entry.packed)
+        return memory
+
+    def record_switch(self, kind: str, start: float) -> None:
+        """Record a floor switch which started at `start`, to a floor which was `kind`."""
+        self.switch_times[kind].append(time.perf_counter() - start)
+
+    def summary(self) -> str:
+        memory = self.memory()
+        current = live_floor_bytes(self.engine.game_map)
+        lines = [
+            f"Floors cached: {len(self.entries)}, resident memory: {(current + memory['live']) // 1024} KiB live"
+            f" (including the current floor), {memory['packed'] // 1024} KiB packed,"
+            f" {memory['spilled'] // 1024} KiB spilled to disk."
+        ]
+        for kind, times in sorted(self.switch_times.items()):
+            lines.append(
+                f"Floor switches to {kind} floors: {len(times)}, {sum(times) / len(times) * 1000:.2f} ms mean,"
+                f" {max(times) * 1000:.2f} ms worst."
+            )
+        return "\n".join(lines)
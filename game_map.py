@@ -1,30 +1,93 @@
 from __future__ import annotations
 
+import concurrent.futures
 import copy
-from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+import random
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, TYPE_CHECKING
 import numpy as np  # type: ignore
 from tcod.console import Console
 from entity import Actor, Item
+from floor_cache import FloorCache
+from map_chunks import CHUNK_SIZE, ChunkedLayer, chunk_region
 import tile_types
 
 if TYPE_CHECKING:
+    from camera import Camera
     from entity import Entity
     from engine import Engine
+    from procgen import FloorLayout
+
+
+def explorable_cells(tile_layout: np.ndarray) -> np.ndarray:
+    """Return every floor tile, and every wall touching a floor tile (diagonals included), of a layout."""
+    width, height = tile_layout.shape
+    floor = tile_layout == 0
+    padded = np.pad(floor, 1)
+    explorable = floor.copy(order="F")
+    for dx in (0, 1, 2):
+        for dy in (0, 1, 2):
+            explorable |= padded[dx: dx + width, dy: dy + height]
+    return explorable
 
 
 class GameMap:
     def __init__(
-            self, engine: Engine, width: int, height: int, entities: Iterable[Entity] = ()
+            self,
+            engine: Engine,
+            width: int,
+            height: int,
+            entities: Iterable[Entity] = (),
+            tile_layout: Optional[np.ndarray] = None,
     ):
+        """Make an empty map of walls, or a map of a loaded `tile_layout`.
+
+        Tiles are only picked for the chunks of the map which are drawn, see update_tile_graphics.
+        Whether a tile can be walked on or seen through comes from the layout.
+        """
         self.engine = engine
         self.width, self.height = width, height
-        self.tile_layout = np.full((width, height), fill_value=1, order="F")  # 2D array of numbers representing floor layout. 0=floor, 1=wall
-        self.tiles = np.full((width, height), fill_value=tile_types.wall, order="F")
+        if tile_layout is None:
+            self.tile_layout = np.full((width, height), fill_value=1, dtype=np.uint8, order="F")  # 2D array of numbers representing floor layout. 0=floor, 1=wall
+        else:
+            self.tile_layout = tile_layout
+        self.tiles = ChunkedLayer((width, height), tile_types.tile_dt, fill_value=tile_types.pillar)
         self.visible = np.full((width, height), fill_value=False, order="F")  # Tiles the player can currently see
-        self.explored = np.full((width, height), fill_value=False, order="F")  # Tiles the player has seen before
-        self.explorable = np.full((width, height), fill_value=False, order="F")  # Tiles the player could currently explore and view
+        self.explored = ChunkedLayer((width, height), bool, fill_value=False)  # Tiles the player has seen before
+        self.explorable = ChunkedLayer((width, height), bool, fill_value=False)  # Tiles the player could currently explore and view
         self.entities = set(entities)
         self.downstairs_location = (0, 0)
+        self.upstairs_location: Optional[Tuple[int, int]] = None  # None on the first floor
+        # The arguments of procgen.generate_layout this floor was generated from, or None if it wasn't recorded.
+        self.generation: Optional[Dict[str, Any]] = None
+        self.generated_layout: Optional[np.ndarray] = None  # The layout as generated, to diff against when packed
+        self.fov_area = (slice(0, width), slice(0, height))  # Area of the map the last FOV was computed over
+        self.drawn_chunks: Set[Tuple[int, int]] = set()  # Chunks whose wall glyphs match the current layout
+        self.names_cache: Dict[Tuple[int, int], str] = {}  # Entity names by location, for the mouse-over text
+        self.names_cache_turn = -1  # The turn the names cache was filled on
+
+    def __setstate__(self, state: dict) -> None:
+        self.upstairs_location = None  # Maps pickled before up stairs existed were all first floors.
+        self.generation = None
+        self.fov_area = (slice(0, state["width"]), slice(0, state["height"]))
+        self.__dict__.update(state)
+        self.tile_layout = np.asarray(self.tile_layout, dtype=np.uint8, order="F")  # An int layout in older maps.
+        if isinstance(self.explored, np.ndarray):  # Maps pickled before the chunked layers.
+            self.explored = ChunkedLayer.from_array(self.explored, fill_value=False)
+        self.generated_layout = None
+        self.rebuild_derived_layers()
+
+    def rebuild_derived_layers(self) -> None:
+        """Rebuild everything derived from the layout, after the layout was loaded."""
+        # Tiles are drawn from the layout when rendered, only the stairs have to be put back.
+        self.tiles = ChunkedLayer((self.width, self.height), tile_types.tile_dt, fill_value=tile_types.pillar)
+        self.tiles[self.downstairs_location] = tile_types.down_stairs
+        if self.upstairs_location is not None:
+            self.tiles[self.upstairs_location] = tile_types.up_stairs
+        self.drawn_chunks = set()
+        self.names_cache = {}
+        self.names_cache_turn = -1
+        self.update_explorable()
 
     @property
     def gamemap(self) -> GameMap:
@@ -61,47 +124,139 @@ class GameMap:
 
         return None
 
+    def actors_within(self, x: int, y: int, radius: float) -> List[Actor]:
+        """Return the living actors within `radius` tiles (Euclidean) of (x, y)."""
+        actors = list(self.actors)
+        if not actors:
+            return []
+        xs, ys = self._actor_coordinates(actors)
+        in_radius = (xs - x) ** 2 + (ys - y) ** 2 <= radius ** 2
+        return [actors[i] for i in np.flatnonzero(in_radius)]
+
+    def nearest_visible_actor(
+            self, x: int, y: int, max_distance: float, exclude: Optional[Actor] = None
+    ) -> Optional[Actor]:
+        """Return the closest living actor in FOV which is strictly closer than `max_distance` to (x, y).
+
+        `exclude` is skipped, so an actor can search for the nearest actor other than itself.
+        """
+        actors = [actor for actor in self.actors if actor is not exclude]
+        if not actors:
+            return None
+        xs, ys = self._actor_coordinates(actors)
+        distances = ((xs - x) ** 2 + (ys - y) ** 2).astype(np.float64)
+        distances[~self.visible[xs, ys]] = np.inf
+        closest = int(np.argmin(distances))
+        if distances[closest] >= max_distance ** 2:
+            return None
+        return actors[closest]
+
+    @staticmethod
+    def _actor_coordinates(actors: List[Actor]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the x and y positions of `actors` as two parallel arrays."""
+        xs = np.fromiter((actor.x for actor in actors), dtype=np.intp, count=len(actors))
+        ys = np.fromiter((actor.y for actor in actors), dtype=np.intp, count=len(actors))
+        return xs, ys
+
+    def update_explorable(self) -> None:
+        self.explorable = ChunkedLayer.from_array(explorable_cells(self.tile_layout), fill_value=False)
+
     def in_bounds(self, x: int, y: int) -> bool:
         """Return True if x and y are inside of the bounds of this map."""
         return 0 <= x < self.width and 0 <= y < self.height
 
-    def render(self, console: Console) -> None:
+    def render(self, console: Console, camera: Camera) -> None:
         """
-        Renders the map.
+        Renders the part of the map inside the camera's viewport.
         If a tile is in the "visible" array, then draw it with the "light" colors.
         If it isn't, but it's in the "explored" array, then draw it with the "dark" color
         Otherwise, the default is "SHROUD".
 
-        If element 1 in condlist is true, do the thing in choicelist 1.
-        Else if element 2 in condlist is true, do the thing in choicelist 2.
+        The layers are copied straight into the console buffer through masks, so drawing a frame
+        doesn't allocate any map-sized temporary arrays.
         """
-
-        self.draw_tile_graphics(self.tile_layout, self.engine)
-
-        game_array = np.select(
-            condlist=[self.visible, self.explored],
-            choicelist=[self.tiles["light"], self.tiles["dark"]],
-            default=tile_types.SHROUD,
-        )
-
-        # self.draw_tile_graphics(self.tile_layout, self.engine)
-
-        console.tiles_rgb[0: self.width, 0: self.height] = game_array
+        window = camera.window
+
+        self.update_tile_graphics(window)
+
+        window_x, window_y = window
+        screen_tiles = console.tiles_rgb[0: window_x.stop - window_x.start, 0: window_y.stop - window_y.start]
+        screen_tiles[...] = tile_types.SHROUD
+        explored = self.explored[window]
+        visible = self.visible[window]
+        # Copied chunk by chunk, the tiles of the window are never gathered into an array of their own.
+        for index, in_chunk, in_window in self.tiles.parts(window):
+            chunk = self.tiles.chunks.get(index)
+            tiles = self.tiles.fill_value if chunk is None else chunk[in_chunk]
+            np.copyto(screen_tiles[in_window], tiles["dark"], where=explored[in_window])
+            np.copyto(screen_tiles[in_window], tiles["light"], where=visible[in_window])
 
         entities_sorted_for_rendering = sorted(
             self.entities, key=lambda x: x.render_order.value
         )
         for entity in entities_sorted_for_rendering:
             # Only print entities that are in the FOV
-            if self.visible[entity.x, entity.y]:
+            if camera.in_view(entity.x, entity.y) and self.visible[entity.x, entity.y]:
+                screen_x, screen_y = camera.map_to_screen(entity.x, entity.y)
                 console.print(
-                    x=entity.x, y=entity.y, string=entity.char, fg=entity.color
+                    x=screen_x, y=screen_y, string=entity.char, fg=entity.color
                 )
 
-    def draw_tile_graphics(self, layout: np.ndarray, engine: Engine):
-        for (x, y), t in np.ndenumerate(layout):
+    def update_tile_graphics(self, area: Tuple[slice, slice]) -> None:
+        """Draw the wall glyphs of every chunk within `area` which changed since it was last drawn.
+
+        Glyphs only depend on the layout and the explorable tiles, so each chunk is drawn once
+        and then kept until `invalidate_tile_graphics` is called for it.
+        """
+        area_x, area_y = area
+        shape = (self.width, self.height)
+        for cx in range(area_x.start // CHUNK_SIZE, -(-area_x.stop // CHUNK_SIZE)):
+            for cy in range(area_y.start // CHUNK_SIZE, -(-area_y.stop // CHUNK_SIZE)):
+                if (cx, cy) not in self.drawn_chunks:
+                    self.draw_tile_graphics(chunk_region(cx, cy, shape))
+                    self.drawn_chunks.add((cx, cy))
+
+    def dig(self, x: int, y: int) -> None:
+        """Turn the tile at (x, y) into floor."""
+        self.tile_layout[x, y] = 0
+        self.tiles[x, y] = tile_types.floor
+        self.invalidate_tile_graphics(x, y)
+
+    def invalidate_tile_graphics(self, x: int, y: int) -> None:
+        """Mark the glyphs around (x, y) to be redrawn, after the layout at (x, y) has changed."""
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                self.drawn_chunks.discard(((x + dx) // CHUNK_SIZE, (y + dy) // CHUNK_SIZE))
+
+    def draw_tile_graphics(self, area: Tuple[slice, slice]):
+        """Pick the floor and wall glyphs for the tiles within `area` of the map.
+
+        The glyphs are picked in a window of the tiles, which is written back to them at once.
+        """
+        area_x, area_y = area
+        left, top = area_x.start, area_y.start
+        tiles = self.tiles[area]
+        # The walls the player could see within `area` and one tile around it, as seen by is_wall_and_visible.
+        around = (
+            slice(max(left - 1, 0), min(area_x.stop + 1, self.width)),
+            slice(max(top - 1, 0), min(area_y.stop + 1, self.height)),
+        )
+        visible_walls = np.zeros((area_x.stop - left + 2, area_y.stop - top + 2), dtype=bool)
+        visible_walls[
+            around[0].start - left + 1: around[0].stop - left + 1, around[1].start - top + 1: around[1].stop - top + 1
+        ] = (self.tile_layout[around] == 1) & self.explorable[around]
+
+        def is_wall_and_visible(x: int, y: int) -> bool:
+            return visible_walls[x - left + 1, y - top + 1]
+
+        stairs = {self.downstairs_location, self.upstairs_location}
+        for (x, y), t in np.ndenumerate(self.tile_layout[area]):
+            x += left
+            y += top
+            if (x, y) in stairs:
+                continue  # Stairs are floor in the layout, but keep their own glyph.
             if t == 0:
-                self.tiles[x, y] = tile_types.floor
+                tiles[x - left, y - top] = tile_types.floor
             elif t == 1:
                 mask = 0
                 '''
@@ -109,32 +264,32 @@ class GameMap:
                 - As you go DOWN the y value increases.
                 - As you go LEFT the X value increases.
                 '''
-                if self.is_wall_and_visible(x, y - 1):  # Above
+                if is_wall_and_visible(x, y - 1):  # Above
                     mask += 1
-                if self.is_wall_and_visible(x, y + 1):  # Below
+                if is_wall_and_visible(x, y + 1):  # Below
                     mask += 2
-                if self.is_wall_and_visible(x - 1, y):  # Left
+                if is_wall_and_visible(x - 1, y):  # Left
                     mask += 4
-                if self.is_wall_and_visible(x + 1, y):  # Right
+                if is_wall_and_visible(x + 1, y):  # Right
                     mask += 8
 
                 if mask == 0:
-                    self.tiles[x, y] = tile_types.new_wall("○")  # Pillar because we can't see neighbors
+                    tiles[x - left, y - top] = tile_types.new_wall("○")  # Pillar because we can't see neighbors
                 elif mask == 1:
-                    self.tiles[x, y] = tile_types.new_wall("║")  # Wall only to the north
+                    tiles[x - left, y - top] = tile_types.new_wall("║")  # Wall only to the north
                 elif mask == 2:
-                    self.tiles[x, y] = tile_types.new_wall("║")  # Wall only to the south
+                    tiles[x - left, y - top] = tile_types.new_wall("║")  # Wall only to the south
                 elif mask == 3:
-                    self.tiles[x, y] = tile_types.new_wall("║")  # Wall to the north and south
+                    tiles[x - left, y - top] = tile_types.new_wall("║")  # Wall to the north and south
                 elif mask == 4:
-                    self.tiles[x, y] = tile_types.new_wall("═")  # Wall only to the west
+                    tiles[x - left, y - top] = tile_types.new_wall("═")  # Wall only to the west
                 elif mask == 5:
-                    self.tiles[x, y] = tile_types.new_wall("╝")  # Wall to the north and west
+                    tiles[x - left, y - top] = tile_types.new_wall("╝")  # Wall to the north and west
                 elif mask == 6:
-                    self.tiles[x, y] = tile_types.new_wall("╗")  # Wall to the south and west
+                    tiles[x - left, y - top] = tile_types.new_wall("╗")  # Wall to the south and west
                 elif mask == 7:
-                    if self.is_wall_and_visible(x - 1, y + 1) and self.is_wall_and_visible(x - 1, y - 1):
-                        self.tiles[x, y] = tile_types.new_wall("║")
+                    if is_wall_and_visible(x - 1, y + 1) and is_wall_and_visible(x - 1, y - 1):
+                        tiles[x - left, y - top] = tile_types.new_wall("║")
                     # elif (self.is_wall_and_visible(x - 1, y + 1) and not self.is_wall_and_visible(x - 1, y + 2) and self.is_wall_and_visible(x, y + 2)) or \
                     #         (self.is_wall_and_visible(x - 1, y + 1) and not self.is_wall_and_visible(x - 1, y + 2) and self.is_wall_and_visible(x + 1, y + 1)):
                     #     self.tiles[x, y] = tile_types.new_wall("╝")
@@ -142,16 +297,16 @@ class GameMap:
                     #         (self.is_wall_and_visible(x - 1, y - 1) and not self.is_wall_and_visible(x - 1, y - 2) and self.is_wall_and_visible(x + 1, y - 1)):
                     #     self.tiles[x, y] = tile_types.new_wall("╗")
                     else:
-                        self.tiles[x, y] = tile_types.new_wall("╣")  # Wall to the north, south and west
+                        tiles[x - left, y - top] = tile_types.new_wall("╣")  # Wall to the north, south and west
                 elif mask == 8:
-                    self.tiles[x, y] = tile_types.new_wall("═")  # Wall only to the east
+                    tiles[x - left, y - top] = tile_types.new_wall("═")  # Wall only to the east
                 elif mask == 9:
-                    self.tiles[x, y] = tile_types.new_wall("╚")  # Wall to the north and east
+                    tiles[x - left, y - top] = tile_types.new_wall("╚")  # Wall to the north and east
                 elif mask == 10:
-                    self.tiles[x, y] = tile_types.new_wall("╔")  # Wall to the south and east
+                    tiles[x - left, y - top] = tile_types.new_wall("╔")  # Wall to the south and east
                 elif mask == 11:
-                    if self.is_wall_and_visible(x + 1, y + 1) and self.is_wall_and_visible(x + 1, y - 1):
-                        self.tiles[x, y] = tile_types.new_wall("║")
+                    if is_wall_and_visible(x + 1, y + 1) and is_wall_and_visible(x + 1, y - 1):
+                        tiles[x - left, y - top] = tile_types.new_wall("║")
                     # elif (self.is_wall_and_visible(x + 1, y + 1) and not self.is_wall_and_visible(x + 1, y + 2) and self.is_wall_and_visible(x, y + 2)) or \
                     #         (self.is_wall_and_visible(x + 1, y + 1) and not self.is_wall_and_visible(x + 1, y + 2) and self.is_wall_and_visible(x - 1, y + 1)):
                     #     self.tiles[x, y] = tile_types.new_wall("╚")
@@ -159,12 +314,12 @@ class GameMap:
                     #         (self.is_wall_and_visible(x + 1, y - 1) and not self.is_wall_and_visible(x + 1, y - 2) and self.is_wall_and_visible(x - 1, y - 1)):
                     #     self.tiles[x, y] = tile_types.new_wall("╔")
                     else:
-                        self.tiles[x, y] = tile_types.new_wall("╠")  # Wall to the north, south and east
+                        tiles[x - left, y - top] = tile_types.new_wall("╠")  # Wall to the north, south and east
                 elif mask == 12:
-                    self.tiles[x, y] = tile_types.new_wall("═")  # Wall to the east and west
+                    tiles[x - left, y - top] = tile_types.new_wall("═")  # Wall to the east and west
                 elif mask == 13:
-                    if self.is_wall_and_visible(x - 1, y - 1) and self.is_wall_and_visible(x + 1, y - 1):
-                        self.tiles[x, y] = tile_types.new_wall("═")
+                    if is_wall_and_visible(x - 1, y - 1) and is_wall_and_visible(x + 1, y - 1):
+                        tiles[x - left, y - top] = tile_types.new_wall("═")
                     # elif (self.is_wall_and_visible(x - 1, y - 1) and not self.is_wall_and_visible(x - 2, y - 1) and self.is_wall_and_visible(x - 2, y)) or \
                     #         (self.is_wall_and_visible(x - 1, y - 1) and not self.is_wall_and_visible(x - 2, y - 1) and self.is_wall_and_visible(x - 1, y + 1)):
                     #     self.tiles[x, y] = tile_types.new_wall("╚")
@@ -172,10 +327,10 @@ class GameMap:
                     #         (self.is_wall_and_visible(x + 1, y - 1) and not self.is_wall_and_visible(x + 2, y - 1) and self.is_wall_and_visible(x + 1, y + 1)):
                     #     self.tiles[x, y] = tile_types.new_wall("╝")
                     else:
-                        self.tiles[x, y] = tile_types.new_wall("╩")  # Wall to the east, west, and south
+                        tiles[x - left, y - top] = tile_types.new_wall("╩")  # Wall to the east, west, and south
                 elif mask == 14:
-                    if self.is_wall_and_visible(x - 1, y + 1) and self.is_wall_and_visible(x + 1, y + 1):
-                        self.tiles[x, y] = tile_types.new_wall("═")
+                    if is_wall_and_visible(x - 1, y + 1) and is_wall_and_visible(x + 1, y + 1):
+                        tiles[x - left, y - top] = tile_types.new_wall("═")
                     # elif (self.is_wall_and_visible(x - 1, y + 1) and not self.is_wall_and_visible(x - 2, y + 1) and self.is_wall_and_visible(x - 2, y)) or \
                     #         (self.is_wall_and_visible(x - 1, y - 1) and not self.is_wall_and_visible(x - 2, y - 1) and self.is_wall_and_visible(x - 1, y - 1)):
                     #     self.tiles[x, y] = tile_types.new_wall("╔")
@@ -183,20 +338,21 @@ class GameMap:
                     #         (self.is_wall_and_visible(x + 1, y + 1) and not self.is_wall_and_visible(x + 2, y + 1) and self.is_wall_and_visible(x + 1, y - 1)):
                     #     self.tiles[x, y] = tile_types.new_wall("╗")
                     else:
-                        self.tiles[x, y] = tile_types.new_wall("╦")  # Wall to the east, west, and north
+                        tiles[x - left, y - top] = tile_types.new_wall("╦")  # Wall to the east, west, and north
                 elif mask == 15:
-                    if not self.is_wall_and_visible(x+1, y-1) and self.is_wall_and_visible(x-1, y+1):
-                        self.tiles[x, y] = tile_types.new_wall("╚")
-                    elif not self.is_wall_and_visible(x+1, y+1) and self.is_wall_and_visible(x-1, y-1):
-                        self.tiles[x, y] = tile_types.new_wall("╔")
-                    elif not self.is_wall_and_visible(x-1, y+1) and self.is_wall_and_visible(x+1, y-1):
-                        self.tiles[x, y] = tile_types.new_wall("╗")
-                    elif not self.is_wall_and_visible(x-1, y-1) and self.is_wall_and_visible(x+1, y+1):
-                        self.tiles[x, y] = tile_types.new_wall("╝")
+                    if not is_wall_and_visible(x+1, y-1) and is_wall_and_visible(x-1, y+1):
+                        tiles[x - left, y - top] = tile_types.new_wall("╚")
+                    elif not is_wall_and_visible(x+1, y+1) and is_wall_and_visible(x-1, y-1):
+                        tiles[x - left, y - top] = tile_types.new_wall("╔")
+                    elif not is_wall_and_visible(x-1, y+1) and is_wall_and_visible(x+1, y-1):
+                        tiles[x - left, y - top] = tile_types.new_wall("╗")
+                    elif not is_wall_and_visible(x-1, y-1) and is_wall_and_visible(x+1, y+1):
+                        tiles[x - left, y - top] = tile_types.new_wall("╝")
                     else:
-                        self.tiles[x, y] = tile_types.new_wall("╬")  # ╬ Wall on all sides
+                        tiles[x - left, y - top] = tile_types.new_wall("╬")  # ╬ Wall on all sides
                 else:
-                    self.tiles[x, y] = tile_types.new_wall()
+                    tiles[x - left, y - top] = tile_types.new_wall()
+        self.tiles[area] = tiles
 
     # def is_T_wall(self, x: int, y:int ) -> bool:
 
@@ -219,9 +375,21 @@ class GameMap:
     #     if self.tile_layout[x, y] == 1:
 
 
+class Prefetch(NamedTuple):
+    """A layout being generated ahead of time for `floor`, in the generation pool of procgen."""
+    floor: int
+    arguments: Dict[str, Any]  # The arguments of generate_layout, but the seed.
+    seed: int
+    future: concurrent.futures.Future
+
+
 class GameWorld:
     """
     Holds the settings for the GameMap, and generates new maps when moving down the stairs.
+
+    The floors the player has left are kept in a FloorCache, so that the stairs lead back to them.
+    The layout of the next new floor is generated in a worker process while the player explores
+    the current one, so that going down to it doesn't wait on procgen.
     """
 
     def __init__(
@@ -246,17 +414,109 @@ class GameWorld:
         self.room_max_size = room_max_size
 
         self.current_floor = current_floor
+        self.floors = FloorCache(engine)
+        self.prefetch: Optional[Prefetch] = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["prefetch"] = None  # Futures can't be pickled, the next floor is prefetched again after loading.
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if "floors" not in state:  # Pickled before floors were kept.
+            self.floors = FloorCache(self.engine)
+        self.prefetch = None
+
+    def layout_arguments(self, floor: int) -> Dict[str, Any]:
+        """Return the arguments of procgen.generate_layout for `floor`, but the seed."""
+        return {
+            "max_rooms": self.max_rooms,
+            "room_min_size": self.room_min_size,
+            "room_max_size": self.room_max_size,
+            "map_width": self.map_width,
+            "map_height": self.map_height,
+            "upstairs": floor > 1,
+        }
 
     def generate_floor(self) -> None:
-        from procgen import generate_dungeon
+        """Generate a new floor below the current one, and move the player onto it."""
+        from procgen import build_dungeon
 
+        start = time.perf_counter()
+        self.leave_floor()
         self.current_floor += 1
+        self.floors.discard(self.current_floor)  # A floor generated again replaces the old one.
 
-        self.engine.game_map = generate_dungeon(
-            max_rooms=self.max_rooms,
-            room_min_size=self.room_min_size,
-            room_max_size=self.room_max_size,
-            map_width=self.map_width,
-            map_height=self.map_height,
-            engine=self.engine,
-        )
+        layout, kind = self.take_layout(self.current_floor)
+        self.engine.game_map = build_dungeon(layout, self.engine)
+        self.floors.settle(self.current_floor)
+        self.floors.record_switch(kind, start)
+        self.prefetch_next_floor()
+
+    def take_layout(self, floor: int) -> Tuple[FloorLayout, str]:
+        """Return the layout of the new `floor`, and "prefetched" or "new" for how it was made.
+
+        The prefetched layout is used if it has finished, otherwise the layout is generated here,
+        from the same seed, so that the floor doesn't depend on how fast the worker was.
+        """
+        from procgen import generate_layout
+
+        arguments = self.layout_arguments(floor)
+        seed = random.getrandbits(64)
+        prefetch, self.prefetch = self.prefetch, None
+        if prefetch is not None:
+            if (prefetch.floor, prefetch.arguments) == (floor, arguments):
+                if prefetch.future.done() and prefetch.future.exception() is None:
+                    return prefetch.future.result(), "prefetched"
+                seed = prefetch.seed
+            prefetch.future.cancel()
+        return generate_layout(**arguments, seed=seed), "new"
+
+    def prefetch_next_floor(self) -> None:
+        """Start generating the layout of the floor below in the background, unless it was visited before."""
+        from procgen import generate_layout, generation_pool
+
+        floor = self.current_floor + 1
+        if floor in self.floors or (self.prefetch is not None and self.prefetch.floor == floor):
+            return
+        arguments = self.layout_arguments(floor)
+        seed = random.getrandbits(64)
+        try:
+            future = generation_pool().submit(generate_layout, **arguments, seed=seed)
+        except (OSError, RuntimeError):
+            return  # No worker process could be started, floors are generated when they're reached.
+        self.prefetch = Prefetch(floor, arguments, seed, future)
+
+    def descend(self) -> None:
+        """Move the player down to the next floor, generating it on the first visit."""
+        if self.current_floor + 1 in self.floors:
+            self.switch_floor(self.current_floor + 1)
+        else:
+            self.generate_floor()
+
+    def ascend(self) -> None:
+        """Move the player up to the previous floor."""
+        self.switch_floor(self.current_floor - 1)
+
+    def switch_floor(self, floor: int) -> None:
+        """Move the player to a floor visited before, onto the stairs back to the floor they came from."""
+        start = time.perf_counter()
+        kind = self.floors.state(floor)
+        game_map = self.floors.take(floor)
+        going_down = floor > self.current_floor
+        self.leave_floor()
+
+        x, y = game_map.upstairs_location if going_down else game_map.downstairs_location
+        self.engine.player.place(x, y, game_map)
+        self.engine.game_map = game_map
+        self.current_floor = floor
+        self.floors.settle(floor)
+        self.floors.record_switch(kind, start)
+        self.prefetch_next_floor()
+
+    def leave_floor(self) -> None:
+        """Keep the current floor in the cache, as the player is about to leave it."""
+        game_map = getattr(self.engine, "game_map", None)  # A new game has no floor yet.
+        if game_map is not None:
+            self.floors.store(self.current_floor, game_map)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import os
-from typing import Callable, Optional, Tuple, TYPE_CHECKING, Union
+from typing import Callable, Hashable, Optional, Tuple, TYPE_CHECKING, Union
 
 import tcod
 import actions
@@ -58,6 +58,9 @@ CONFIRM_KEYS = {
     tcod.event.K_KP_ENTER,
 }
 
+REST_TURNS = 100  # How long 'z' rests for when no count is given.
+MAX_REPEAT_COUNT = 999
+
 ActionOrHandler = Union[Action, "BaseEventHandler"]
 """An event handler return value which can trigger an action or switch active handlers.
 
@@ -76,9 +79,27 @@ class BaseEventHandler(tcod.event.EventDispatch[ActionOrHandler]):
         assert not isinstance(state, Action), f"{self!r} can not handle actions."
         return self
 
+    def handle_repeated_key(self, event: tcod.event.KeyDown, count: int) -> BaseEventHandler:
+        """Handle `count` auto-repeats of a held key, merged by the main loop into one event.
+
+        By default the key is handled `count` times, as if each repeat had been seen separately.
+        """
+        handler: BaseEventHandler = self
+        for _ in range(count):
+            handler = handler.handle_events(event)
+        return handler
+
     def on_render(self, console: tcod.Console) -> None:
         raise NotImplementedError()
 
+    def view_state(self) -> Hashable:
+        """Return a value which changes whenever what this handler renders changes.
+
+        The main loop only renders a new frame when the active handler or this value changes,
+        so events which change nothing (key releases, mouse moves within a tile) cost no frame.
+        """
+        return None
+
     def ev_quit(self, event: tcod.event.Quit) -> Optional[Action]:
         raise SystemExit()
 
@@ -137,6 +158,9 @@ class EventHandler(BaseEventHandler):
         if action is None:
             return False
 
+        if isinstance(action, actions.MultiTurnAction):
+            return self.handle_multi_turn_action(action)
+
         try:
             action.perform()
         except exceptions.Impossible as exc:
@@ -146,11 +170,44 @@ class EventHandler(BaseEventHandler):
         self.engine.handle_enemy_turns()
 
         self.engine.update_fov()
+        self.engine.turn_count += 1
         return True
 
+    def handle_multi_turn_action(self, action: actions.MultiTurnAction) -> bool:
+        """Perform the turns of a multi-turn action back to back, without rendering between them.
+
+        Stops when the action is finished, a turn is impossible, or something interrupts it.
+        Returns True if at least one turn was taken.
+        """
+        turns = 0
+        while turns < action.max_turns:
+            try:
+                turn_action = action.next_action()
+            except exceptions.Impossible as exc:
+                self.engine.message_log.add_message(exc.args[0], color.impossible)
+                break
+            if not self.handle_action(turn_action):
+                break
+            turns += 1
+            if action.interrupted():
+                break
+        return turns > 0
+
+    def mouse_tile_to_map(self, tile: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        """Return the map position under a mouse tile, or None if the tile isn't over the map."""
+        x, y = self.engine.camera.screen_to_map(*tile)
+        if self.engine.camera.in_view(x, y) and self.engine.game_map.in_bounds(x, y):
+            return x, y
+        return None
+
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
-        if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+        map_xy = self.mouse_tile_to_map(event.tile)
+        if map_xy:
+            self.engine.mouse_location = map_xy
+
+    def view_state(self) -> Hashable:
+        """Actions which advance a turn always switch handlers, so only messages and the mouse remain."""
+        return self.engine.message_log.revision, self.engine.mouse_location
 
     def on_render(self, console: tcod.Console) -> None:
         self.engine.render(console)
@@ -190,7 +247,8 @@ class CharacterScreenEventHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)
 
-        if self.engine.player.x <= 30:
+        player_screen_x, _ = self.engine.camera.map_to_screen(self.engine.player.x, self.engine.player.y)
+        if player_screen_x <= 30:
             x = 40
         else:
             x = 0
@@ -236,7 +294,8 @@ class LevelUpEventHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)
 
-        if self.engine.player.x <= 30:
+        player_screen_x, _ = self.engine.camera.map_to_screen(self.engine.player.x, self.engine.player.y)
+        if player_screen_x <= 30:
             x = 40
         else:
             x = 0
@@ -320,7 +379,8 @@ class InventoryEventHandler(AskUserEventHandler):
         if height <= 3:
             height = 3
 
-        if self.engine.player.x <= 30:
+        player_screen_x, _ = self.engine.camera.map_to_screen(self.engine.player.x, self.engine.player.y)
+        if player_screen_x <= 30:
             x = 40
         else:
             x = 0
@@ -410,7 +470,7 @@ class SelectIndexHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         """Highlight the tile under the cursor."""
         super().on_render(console)
-        x, y = self.engine.mouse_location
+        x, y = self.engine.camera.map_to_screen(*self.engine.mouse_location)
         console.tiles_rgb["bg"][x, y] = color.white
         console.tiles_rgb["fg"][x, y] = color.black
 
@@ -430,9 +490,10 @@ class SelectIndexHandler(AskUserEventHandler):
             dx, dy = MOVE_KEYS[key]
             x += dx * modifier
             y += dy * modifier
-            # Clamp the cursor index to the map size.
-            x = max(0, min(x, self.engine.game_map.width - 1))
-            y = max(0, min(y, self.engine.game_map.height - 1))
+            # Clamp the cursor index to the part of the map on screen.
+            window_x, window_y = self.engine.camera.window
+            x = max(window_x.start, min(x, window_x.stop - 1))
+            y = max(window_y.start, min(y, window_y.stop - 1))
             self.engine.mouse_location = x, y
             return None
         elif key in CONFIRM_KEYS:
@@ -441,9 +502,10 @@ class SelectIndexHandler(AskUserEventHandler):
 
     def ev_mousebuttondown(self, event: tcod.event.MouseButtonDown) -> Optional[ActionOrHandler]:
         """Left click confirms a selection."""
-        if self.engine.game_map.in_bounds(*event.tile):
+        map_xy = self.mouse_tile_to_map(event.tile)
+        if map_xy:
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(*map_xy)
         return super().ev_mousebuttondown(event)
 
     def on_index_selected(self, x: int, y: int) -> Optional[ActionOrHandler]:
@@ -457,7 +519,7 @@ class LookHandler(SelectIndexHandler):
         self.x = 0
         self.y = 0
         super().__init__(engine)
-        self.engine.message_log.add_message("Press 'd' to Dig.")
+        self.engine.message_log.add_message("Press 'd' to Dig, or 't' to travel there.")
 
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
         """Check for key movement or confirmation keys."""
@@ -475,9 +537,10 @@ class LookHandler(SelectIndexHandler):
             dx, dy = MOVE_KEYS[key]
             self.x += dx * modifier
             self.y += dy * modifier
-            # Clamp the cursor index to the map size.
-            self.x = max(0, min(self.x, self.engine.game_map.width - 1))
-            self.y = max(0, min(self.y, self.engine.game_map.height - 1))
+            # Clamp the cursor index to the part of the map on screen.
+            window_x, window_y = self.engine.camera.window
+            self.x = max(window_x.start, min(self.x, window_x.stop - 1))
+            self.y = max(window_y.start, min(self.y, window_y.stop - 1))
             self.engine.mouse_location = self.x, self.y
             return None
         elif key in CONFIRM_KEYS:
@@ -485,6 +548,8 @@ class LookHandler(SelectIndexHandler):
         elif key == tcod.event.K_d:
             print(self.x, self.y)
             return actions.DigAction(self.engine.player, self.x, self.y)
+        elif key == tcod.event.K_t:
+            return actions.TravelAction(self.engine.player, *self.engine.mouse_location)
         else:
             return super().ev_keydown(event)
 
@@ -525,7 +590,7 @@ class AreaRangedAttackHandler(SelectIndexHandler):
         """Highlight the tile under the cursor."""
         super().on_render(console)
 
-        x, y = self.engine.mouse_location
+        x, y = self.engine.camera.map_to_screen(*self.engine.mouse_location)
 
         # Draw a rectangle around the targeted area, so the player can see the affected tiles.
         console.draw_frame(
@@ -542,6 +607,29 @@ class AreaRangedAttackHandler(SelectIndexHandler):
 
 
 class MainGameEventHandler(EventHandler):
+    def __init__(self, engine: Engine):
+        super().__init__(engine)
+        self.count = 0  # A count typed before a command repeats that command, like "5l".
+
+    def view_state(self) -> Hashable:
+        return super().view_state(), self.count
+
+    def handle_repeated_key(self, event: tcod.event.KeyDown, count: int) -> BaseEventHandler:
+        """Take a held movement or wait key's repeats as one repeated action.
+
+        This stops early on the usual interruptions, where handling each repeat alone would not.
+        """
+        shifted = event.mod & (tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT)
+        if (event.sym in MOVE_KEYS or event.sym in WAIT_KEYS) and not shifted:
+            self.count = count
+            return self.handle_events(event)
+        return super().handle_repeated_key(event, count)
+
+    def on_render(self, console: tcod.Console) -> None:
+        super().on_render(console)
+        if self.count:
+            console.print(x=0, y=48, string=f"Repeat: {self.count}")
+
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
         action: Optional[Action] = None
 
@@ -550,16 +638,23 @@ class MainGameEventHandler(EventHandler):
 
         player = self.engine.player
 
-        if key == tcod.event.K_PERIOD and modifier & (
+        if key in (tcod.event.K_PERIOD, tcod.event.K_COMMA) and modifier & (
                 tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT
         ):
-            return actions.TakeStairsAction(player)
+            return actions.TakeStairsAction(player)  # '>' or '<', whichever stairs are here.
+
+        if tcod.event.K_0 <= key <= tcod.event.K_9:
+            self.count = min(self.count * 10 + key - tcod.event.K_0, MAX_REPEAT_COUNT)
+            return None
 
         if key in MOVE_KEYS:
             dx, dy = MOVE_KEYS[key]
             action = BumpAction(player, dx, dy)
         elif key in WAIT_KEYS:
             action = WaitAction(player)
+        elif key == tcod.event.K_z:
+            count, self.count = self.count, 0
+            return actions.RestAction(player, turns=count or REST_TURNS)
         elif key == tcod.event.K_ESCAPE:
             raise SystemExit()
         elif key == tcod.event.K_v:
@@ -574,9 +669,15 @@ class MainGameEventHandler(EventHandler):
             return CharacterScreenEventHandler(self.engine)
         elif key == tcod.event.K_SLASH:
             return LookHandler(self.engine)
+        elif key == tcod.event.K_x:
+            action = actions.AutoExploreAction(player)
         elif key == tcod.event.K_t:
             return
 
+        if action is not None:
+            count, self.count = self.count, 0
+            if count > 1:
+                return actions.RepeatAction(player, action, count)
         # No valid key was pressed
         return action
 
@@ -584,8 +685,11 @@ class MainGameEventHandler(EventHandler):
 class GameOverEventHandler(EventHandler):
     def on_quit(self) -> None:
         """Handle exiting out of a finished game."""
-        if os.path.exists("savegame.sav"):
-            os.remove("savegame.sav")  # Deletes the active save file.
+        if os.path.exists(self.engine.save_path):
+            os.remove(self.engine.save_path)  # Deletes the active save file.
+        archive_path = self.engine.message_log.archive_path
+        if archive_path and os.path.exists(archive_path):
+            os.remove(archive_path)  # Deletes the spilled message history.
         raise exceptions.QuitWithoutSaving()  # Avoid saving a finished game.
 
     def ev_quit(self, event: tcod.event.Quit) -> None:
@@ -609,13 +713,25 @@ class HistoryViewer(EventHandler):
 
     def __init__(self, engine: Engine):
         super().__init__(engine)
-        self.log_length = len(engine.message_log.messages)
+        self.log_start = engine.message_log.first_index
+        self.log_length = len(engine.message_log)
         self.cursor = self.log_length - 1
+        self.log_console: Optional[tcod.Console] = None
+
+    def view_state(self) -> Hashable:
+        return super().view_state(), self.cursor
+
+    def get_log_console(self, console: tcod.Console) -> tcod.Console:
+        """Return the offscreen console for the log window, only making a new one when `console` is resized."""
+        width, height = console.width - 6, console.height - 6
+        if self.log_console is None or (self.log_console.width, self.log_console.height) != (width, height):
+            self.log_console = tcod.Console(width, height)
+        return self.log_console
 
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)  # Draw the main state as the background.
 
-        log_console = tcod.Console(console.width - 6, console.height - 6)
+        log_console = self.get_log_console(console)
 
         # Draw a frame with a custom banner title.
         log_console.draw_frame(0, 0, log_console.width, log_console.height)
@@ -623,14 +739,20 @@ class HistoryViewer(EventHandler):
             0, 0, log_console.width, 1, "┤Message history├", alignment=tcod.CENTER
         )
 
+        # Only the messages which fill the window up to the cursor are needed.
+        message_log = self.engine.message_log
+        first_shown = message_log.seek_line(
+            self.cursor + 1, log_console.width - 2, log_console.height - 2
+        )
+
         # Render the message log using the cursor parameter.
-        self.engine.message_log.render_messages(
+        message_log.render_messages(
             log_console,
             1,
             1,
             log_console.width - 2,
             log_console.height - 2,
-            self.engine.message_log.messages[: self.cursor + 1],
+            message_log.view(first_shown, self.cursor + 1),
         )
         log_console.blit(console, 3, 3)
 
@@ -638,17 +760,17 @@ class HistoryViewer(EventHandler):
         # Fancy conditional movement to make it feel right.
         if event.sym in CURSOR_Y_KEYS:
             adjust = CURSOR_Y_KEYS[event.sym]
-            if adjust < 0 and self.cursor == 0:
+            if adjust < 0 and self.cursor == self.log_start:
                 # Only move from the top to the bottom when you're on the edge.
                 self.cursor = self.log_length - 1
             elif adjust > 0 and self.cursor == self.log_length - 1:
                 # Same with bottom to top movement.
-                self.cursor = 0
+                self.cursor = self.log_start
             else:
                 # Otherwise move while staying clamped to the bounds of the history log.
-                self.cursor = max(0, min(self.cursor + adjust, self.log_length - 1))
+                self.cursor = max(self.log_start, min(self.cursor + adjust, self.log_length - 1))
         elif event.sym == tcod.event.K_HOME:
-            self.cursor = 0  # Move directly to the top message.
+            self.cursor = self.log_start  # Move directly to the top message.
         elif event.sym == tcod.event.K_END:
             self.cursor = self.log_length - 1  # Move directly to the last message.
         else:  # Any other key moves back to the main game state.
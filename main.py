@@ -1,30 +1,162 @@
 #!/usr/bin/env python3
 # up to here, Part
+import startup_profile  # First, so that the startup timeline covers every other import.
+import argparse
+import time
+from typing import Iterable, List, Tuple
 import tcod
 import traceback
+import autosave
 import color
 import exceptions
 import input_handlers
 import setup_game
+import tilesets
+
+startup_profile.mark("import main menu modules")
 
 WindowWidth, WindowHeight = 1800, 1200  # Window pixel resolution (when not maximized.)
 WindowFlags = tcod.context.SDL_WINDOW_RESIZABLE
 
+NEXT_TILESET_KEY = tcod.event.K_F10
+
+# Window events after which the window contents have to be presented again.
+REPAINT_WINDOW_EVENTS = {
+    "WindowShown",
+    "WindowExposed",
+    "WindowResized",
+    "WindowSizeChanged",
+    "WindowMaximized",
+    "WindowRestored",
+}
+
 
-def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
-    """If the current event handler has an active Engine then save it."""
+def save_game(handler: input_handlers.BaseEventHandler) -> None:
+    """If the current event handler has an active Engine then save it to its slot."""
     if isinstance(handler, input_handlers.EventHandler):
-        handler.engine.save_as(filename)
+        handler.engine.save_as(handler.engine.save_path)
         print("Game saved.")
 
 
+def finish_autosave(autosaver: autosave.Autosaver) -> None:
+    """Wait for the autosave in progress, printing its error to stderr if it failed, rather than raising it."""
+    try:
+        autosaver.wait()
+    except Exception:
+        traceback.print_exc()
+
+
+def coalesce_mouse_motion(events: Iterable[tcod.event.Event]) -> List[tcod.event.Event]:
+    """Return `events` with each run of consecutive mouse motions reduced to its last motion.
+
+    Only the final position of a mouse sweep matters, so the rest would only cost extra work.
+    """
+    coalesced: List[tcod.event.Event] = []
+    for event in events:
+        if (
+            isinstance(event, tcod.event.MouseMotion)
+            and coalesced
+            and isinstance(coalesced[-1], tcod.event.MouseMotion)
+        ):
+            coalesced[-1] = event
+        else:
+            coalesced.append(event)
+    return coalesced
+
+
+def batch_key_repeats(
+    events: Iterable[tcod.event.Event], policy: str, max_repeats: int
+) -> List[Tuple[tcod.event.Event, int]]:
+    """Return `events` paired with how many times each should be handled, following `policy`.
+
+    A held key fills the queue with auto-repeated KeyDown events. With the "all" policy each
+    repeat is handled on its own. "drop" keeps at most `max_repeats` repeats of each held key
+    and drops the stale rest. "merge" also caps the repeats, then hands them to the handler as
+    a single event with a count, so that a held movement key becomes one interruptible action.
+    """
+    batched: List[Tuple[tcod.event.Event, int]] = []
+    held_key = None
+    repeats = 0
+    for event in events:
+        if policy == "all" or not isinstance(event, tcod.event.KeyDown) or not event.repeat:
+            held_key = None
+            batched.append((event, 1))
+            continue
+        key = event.sym, event.mod
+        if key != held_key:
+            held_key, repeats = key, 0
+        repeats += 1
+        if repeats > max_repeats:
+            continue  # A stale repeat, from a key held down while the game was busy.
+        if policy == "merge" and repeats > 1:
+            batched[-1] = (event, repeats)  # The last entry holds this key's earlier repeats.
+        else:
+            batched.append((event, 1))
+    return batched
+
+
+class QueueLatency:
+    """The time input events wait in an event batch before they've been handled."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+    def record(self, batch_time: float) -> None:
+        """Record an event handled now, from the batch received at `batch_time`."""
+        latency = time.perf_counter() - batch_time
+        self.count += 1
+        self.total += latency
+        self.worst = max(self.worst, latency)
+
+    def summary(self) -> str:
+        if not self.count:
+            return "No key events handled."
+        return (
+            f"Key event queue latency: {self.total / self.count * 1000:.1f} ms mean,"
+            f" {self.worst * 1000:.1f} ms worst over {self.count} events."
+        )
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Realms of the Ascended")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print an import and initialization timeline once the first frame is shown",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print frame, key latency, autosave and floor cache statistics on exit",
+    )
+    parser.add_argument(
+        "--key-repeat",
+        choices=("all", "drop", "merge"),
+        default="merge",
+        help="how auto-repeats of a held key are handled when they pile up (default: merge)",
+    )
+    parser.add_argument(
+        "--max-key-repeats",
+        type=int,
+        default=4,
+        help="repeats of a held key kept per batch of events, the rest are dropped (default: 4)",
+    )
+    parser.add_argument(
+        "--autosave-turns",
+        type=int,
+        default=autosave.AUTOSAVE_TURNS,
+        help=f"turns between autosaves (default: {autosave.AUTOSAVE_TURNS})",
+    )
+    args = parser.parse_args()
+
     screen_width = 80
     screen_height = 50
 
-    tileset = tcod.tileset.load_tilesheet(
-        "Redjack17_edit.png", 16, 16, tcod.tileset.CHARMAP_CP437
-    )
+    tileset_manager = tilesets.TilesetManager()
+    tileset = tileset_manager.tileset
+    startup_profile.mark("load tileset")
 
     handler: input_handlers.BaseEventHandler = setup_game.MainMenu()
 
@@ -38,16 +170,47 @@ def main() -> None:
         tileset=tileset,
         sdl_window_flags=WindowFlags
     ) as context:
+        startup_profile.mark("create window")
+        frames_presented = 0
+        event_batches = 0
+        key_latency = QueueLatency()
+        autosaver = autosave.Autosaver(interval=args.autosave_turns)
+        needs_render = True
         try:
             while True:
-                root_console.clear()
-                handler.on_render(console=root_console)
-                context.present(root_console)
+                if needs_render:
+                    root_console.clear()
+                    handler.on_render(console=root_console)
+                    context.present(root_console)
+                    frames_presented += 1
+                    if frames_presented == 1:
+                        startup_profile.mark("present first frame")
+                        if args.profile_startup:
+                            startup_profile.print_timeline()
 
+                # Only render again if the events changed what the active handler shows.
+                previous_view = handler, handler.view_state()
+                needs_render = False
                 try:
-                    for event in tcod.event.wait():
+                    events = coalesce_mouse_motion(tcod.event.wait())
+                    batch_time = time.perf_counter()
+                    for event, count in batch_key_repeats(events, args.key_repeat, args.max_key_repeats):
                         context.convert_event(event)
-                        handler = handler.handle_events(event)
+                        if isinstance(event, tcod.event.KeyDown) and event.sym == NEXT_TILESET_KEY:
+                            # Switch to the next bundled tileset, on any screen.
+                            context.change_tileset(tileset_manager.next_tileset())
+                            needs_render = True
+                            continue
+                        if count > 1:
+                            handler = handler.handle_repeated_key(event, count)
+                        else:
+                            handler = handler.handle_events(event)
+                        if isinstance(event, tcod.event.KeyDown):
+                            key_latency.record(batch_time)
+                        if isinstance(event, tcod.event.WindowEvent) and event.type in REPAINT_WINDOW_EVENTS:
+                            needs_render = True
+                    if isinstance(handler, input_handlers.EventHandler):
+                        autosaver.update(handler.engine)
                 except Exception:  # Handle exceptions in game.
                     traceback.print_exc()  # Print error to stderr.
                     # Then print the error to the message log.
@@ -55,14 +218,27 @@ def main() -> None:
                         handler.engine.message_log.add_message(
                             traceback.format_exc(), color.error
                         )
+                event_batches += 1
+                needs_render |= (handler, handler.view_state()) != previous_view
         except exceptions.QuitWithoutSaving:
             raise
         except SystemExit:  # Save and quit.
-            save_game(handler, "savegame.sav")
+            finish_autosave(autosaver)  # A failed autosave mustn't keep this save from happening.
+            save_game(handler)
             raise
         except BaseException:  # Save on any other unexpected exception.
-            save_game(handler, "savegame.sav")
+            finish_autosave(autosaver)
+            save_game(handler)
             raise
+        finally:
+            finish_autosave(autosaver)
+            autosaver.close()
+            if args.stats:
+                print(f"Presented {frames_presented} frames for {event_batches} event batches.")
+                print(key_latency.summary())
+                print(autosaver.summary())
+                if isinstance(handler, input_handlers.EventHandler):
+                    print(handler.engine.game_world.floors.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,212 @@
+"""Chunked storage and bit masks for the per-cell layers of a GameMap.
+
+Maps are split into CHUNK_SIZE x CHUNK_SIZE chunks, so that work which only concerns the area around
+the player, such as the field of view and redrawing wall glyphs, is done on a window of whole chunks.
+
+The layers a big map has most of, its tiles and its explored and explorable cells, are kept as a
+ChunkedLayer, which only allocates the chunks holding something other than the layer's fill value.
+Untouched solid rock costs nothing, and dense arrays are only built for the windows handed to
+tcod and the renderer.
+
+Bool layers are saved as a BitMask, at one bit per cell.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np  # type: ignore
+
+CHUNK_SIZE = 32
+
+Region = Tuple[slice, slice]
+
+
+def chunk_region(cx: int, cy: int, shape: Tuple[int, int]) -> Region:
+    """Return the 2D array index of chunk (cx, cy), clipped to `shape`."""
+    width, height = shape
+    return (
+        slice(cx * CHUNK_SIZE, min((cx + 1) * CHUNK_SIZE, width)),
+        slice(cy * CHUNK_SIZE, min((cy + 1) * CHUNK_SIZE, height)),
+    )
+
+
+def area_of_interest(
+        shape: Tuple[int, int], x1: int, y1: int, x2: int, y2: int, margin: int = 0
+) -> Region:
+    """Return the 2D array index of the chunks intersecting the box (x1, y1)-(x2, y2), grown by `margin`.
+
+    The box is inclusive and is clipped to `shape`.
+    """
+    width, height = shape
+    left = max(0, min(x1, x2) - margin) // CHUNK_SIZE * CHUNK_SIZE
+    top = max(0, min(y1, y2) - margin) // CHUNK_SIZE * CHUNK_SIZE
+    right = min(width, (max(x1, x2) + margin) // CHUNK_SIZE * CHUNK_SIZE + CHUNK_SIZE)
+    bottom = min(height, (max(y1, y2) + margin) // CHUNK_SIZE * CHUNK_SIZE + CHUNK_SIZE)
+    return slice(left, right), slice(top, bottom)
+
+
+class ChunkedLayer:
+    """A 2D array of which only the chunks holding something other than `fill_value` are allocated.
+
+    Indexing a cell returns that cell. Indexing with slices returns a dense copy of the window, and
+    assigning to a window writes it back, allocating the chunks it leaves different from the fill.
+    """
+
+    def __init__(self, shape: Tuple[int, int], dtype: np.dtype, fill_value: Any):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.fill_value = np.array(fill_value, dtype=self.dtype)
+        self.chunks: Dict[Tuple[int, int], np.ndarray] = {}
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, fill_value: Any) -> ChunkedLayer:
+        layer = cls(array.shape, array.dtype, fill_value)
+        layer[:, :] = array
+        return layer
+
+    @property
+    def nbytes(self) -> int:
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def to_array(self) -> np.ndarray:
+        """Return the whole layer as a dense array."""
+        return self[:, :]
+
+    def _window(self, key: Tuple[Any, Any]) -> Tuple[Region, Tuple[bool, bool]]:
+        """Return the region indexed by `key`, and which of its axes were indexed by a single cell."""
+        region = []
+        single = []
+        for index, size in zip(key, self.shape):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(size)
+                if step != 1:
+                    raise IndexError("Chunked layers can only be sliced with a step of 1.")
+                region.append(slice(start, max(start, stop)))
+                single.append(False)
+            else:
+                if not 0 <= index < size:
+                    raise IndexError(f"Index {index} is out of bounds for a layer of shape {self.shape}.")
+                region.append(slice(int(index), int(index) + 1))
+                single.append(True)
+        return (region[0], region[1]), (single[0], single[1])
+
+    def parts(self, region: Region) -> Iterator[Tuple[Tuple[int, int], Region, Region]]:
+        """Iterate over the chunks overlapping `region`, with the overlap indexed in the chunk and in `region`."""
+        columns = axis_parts(region[0])
+        for cy, y_in_chunk, y_in_region in axis_parts(region[1]):
+            for cx, x_in_chunk, x_in_region in columns:
+                yield (cx, cy), (x_in_chunk, y_in_chunk), (x_in_region, y_in_region)
+
+    def _allocate(self, index: Tuple[int, int]) -> np.ndarray:
+        chunk_x, chunk_y = chunk_region(*index, self.shape)
+        chunk = self.chunks[index] = np.full(
+            (chunk_x.stop - chunk_x.start, chunk_y.stop - chunk_y.start), self.fill_value, order="F"
+        )
+        return chunk
+
+    def __getitem__(self, key: Tuple[Any, Any]) -> Any:
+        x, y = key
+        if not isinstance(x, slice) and not isinstance(y, slice):
+            self._window(key)  # Bounds check.
+            chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+            return self.fill_value[()] if chunk is None else chunk[x % CHUNK_SIZE, y % CHUNK_SIZE]
+        region, (single_x, single_y) = self._window(key)
+        region_x, region_y = region
+        window = np.full(
+            (region_x.stop - region_x.start, region_y.stop - region_y.start), self.fill_value, order="F"
+        )
+        for index, in_chunk, in_window in self.parts(region):
+            chunk = self.chunks.get(index)
+            if chunk is not None:
+                window[in_window] = chunk[in_chunk]
+        if single_x:
+            window = window[0]
+        elif single_y:
+            window = window[:, 0]
+        return window
+
+    def __setitem__(self, key: Tuple[Any, Any], value: Any) -> None:
+        region, (single_x, single_y) = self._window(key)
+        region_x, region_y = region
+        value = np.asarray(value, dtype=self.dtype)
+        if value.ndim and single_x:
+            value = value[np.newaxis]
+        elif value.ndim and single_y:
+            value = value[:, np.newaxis]
+        shape = (region_x.stop - region_x.start, region_y.stop - region_y.start)
+        if value.shape != shape:
+            value = np.broadcast_to(value, shape)
+        for index, in_chunk, in_window in self.parts(region):
+            chunk = self.chunks.get(index)
+            if chunk is None:
+                if not (value[in_window] != self.fill_value).any():
+                    continue  # Still all fill, leave it unallocated.
+                chunk = self._allocate(index)
+            chunk[in_chunk] = value[in_window]
+
+    def set_where(self, region: Region, mask: np.ndarray, value: Any) -> None:
+        """Set the cells of `region` which are True in `mask` to `value`.
+
+        Unlike assigning to the window, only the chunks `mask` sets cells in are touched.
+        """
+        for index, in_chunk, in_window in self.parts(region):
+            cells = mask[in_window]
+            if cells.any():
+                chunk = self.chunks.get(index)
+                if chunk is None:
+                    chunk = self._allocate(index)
+                chunk[in_chunk][cells] = value
+
+
+def axis_parts(index: slice) -> List[Tuple[int, slice, slice]]:
+    """Return the chunks along one axis which overlap `index`, with the overlap indexed in the chunk and in `index`."""
+    parts = []
+    for c in range(index.start // CHUNK_SIZE, -(-index.stop // CHUNK_SIZE)):
+        start = max(index.start, c * CHUNK_SIZE)
+        stop = min(index.stop, (c + 1) * CHUNK_SIZE)
+        parts.append(
+            (c, slice(start - c * CHUNK_SIZE, stop - c * CHUNK_SIZE), slice(start - index.start, stop - index.start))
+        )
+    return parts
+
+
+class BitMask:
+    """A 2D bool array packed eight cells to a byte, in Fortran order.
+
+    `bits` holds the cells in the order of `array.ravel(order="F")`, least significant bit first.
+    """
+
+    def __init__(self, shape: Tuple[int, int], bits: Optional[np.ndarray] = None):
+        self.shape = shape
+        size = shape[0] * shape[1]
+        self.bits = np.zeros(-(-size // 8), dtype=np.uint8) if bits is None else bits
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> BitMask:
+        return cls(array.shape, np.packbits(array.ravel(order="F"), bitorder="little"))
+
+    @classmethod
+    def from_bytes(cls, data: bytes, shape: Tuple[int, int]) -> BitMask:
+        return cls(shape, np.frombuffer(data, dtype=np.uint8).copy())
+
+    def to_array(self) -> np.ndarray:
+        """Return the cells unpacked into a bool array."""
+        size = self.shape[0] * self.shape[1]
+        cells = np.unpackbits(self.bits, count=size, bitorder="little").view(bool)
+        return cells.reshape(self.shape, order="F")
+
+    def tobytes(self) -> bytes:
+        return self.bits.tobytes()
+
+    def __xor__(self, other: BitMask) -> BitMask:
+        return BitMask(self.shape, self.bits ^ other.bits)
+
+    def flatnonzero(self) -> np.ndarray:
+        """Return the Fortran order flat indices of the cells which are set, like np.flatnonzero.
+
+        Only the bytes with a bit set are unpacked, so this is fast for a sparse mask, such as the
+        difference between two versions of a layer.
+        """
+        nonzero = np.flatnonzero(self.bits != 0)  # Much faster than np.flatnonzero on the uint8 bytes.
+        set_bits = np.flatnonzero(np.unpackbits(self.bits[nonzero], bitorder="little"))
+        return nonzero[set_bits >> 3] * 8 + (set_bits & 7)
@@ -1,16 +1,38 @@
-from typing import Iterable, List, Reversible, Tuple
+from __future__ import annotations
+
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Reversible, Tuple
+import bisect
+import collections
+import itertools
+import json
+import os
 import textwrap
+import zlib
 
 import tcod
 
 import color
 
+ARCHIVE_BLOCK_SIZE = 256  # Messages spilled to the archive at a time.
+
 
 class Message:
     def __init__(self, text: str, fg: Tuple[int, int, int]):
         self.plain_text = text
         self.fg = fg
         self.count = 1
+        self._wrapped: Dict[int, List[str]] = {}  # Wrapped lines of `full_text` by width.
+        self._wrapped_count = 1  # The `count` the wrapped lines were made for.
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_wrapped"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._wrapped = {}
+        self._wrapped_count = self.count
 
     @property
     def full_text(self) -> str:
@@ -19,10 +41,113 @@ class Message:
             return f"{self.plain_text} (x{self.count})"
         return self.plain_text
 
+    def wrapped(self, width: int) -> List[str]:
+        """Return `full_text` wrapped to `width`, reusing earlier results until the count changes."""
+        if self._wrapped_count != self.count:
+            self._wrapped.clear()
+            self._wrapped_count = self.count
+        lines = self._wrapped.get(width)
+        if lines is None:
+            lines = self._wrapped[width] = list(MessageLog.wrap(self.full_text, width))
+        return lines
+
+
+class MessageRange:
+    """The messages of a log from index `start` up to `stop`, looked up by index instead of copied."""
+
+    def __init__(self, log: MessageLog, start: int, stop: int):
+        self.log = log
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return max(0, self.stop - self.start)
+
+    def __iter__(self) -> Iterator[Message]:
+        for index in range(self.start, self.stop):
+            yield self.log[index]
+
+    def __reversed__(self) -> Iterator[Message]:
+        for index in range(self.stop - 1, self.start - 1, -1):
+            yield self.log[index]
+
 
 class MessageLog:
-    def __init__(self) -> None:
-        self.messages: List[Message] = []
+    """The game's messages, newest last.
+
+    Only the most recent messages are kept in memory. Once more than `capacity` are held, the
+    oldest ones are spilled in compressed blocks to the append-only file at `archive_path`, and
+    are read back from it on demand. Without an `archive_path` they are discarded instead.
+    """
+
+    def __init__(self, capacity: int = 1000, archive_path: Optional[str] = None) -> None:
+        self.messages: Deque[Message] = collections.deque()  # The messages still held in memory.
+        self.capacity = capacity
+        self.archive_path = archive_path
+        self.spilled_count = 0  # Messages moved out of memory, which come before `messages`.
+        self.archive_blocks: List[Tuple[int, int]] = []  # (offset, length) of each archived block.
+        self.revision = 0  # Increases every time a message is added or stacked.
+        self._block_cache: Tuple[int, List[Message]] = (-1, [])
+        # Lines taken up by the in-memory messages before each one, by wrapping width.
+        self._line_offsets: Dict[int, List[int]] = {}
+        # In-memory messages older than `messages` which haven't been loaded yet, see defer_older_messages.
+        self._deferred_count = 0
+        self._deferred_loader: Optional[Callable[[], List[Message]]] = None
+
+    def __getstate__(self) -> dict:
+        self.hydrate()
+        state = self.__dict__.copy()
+        del state["_block_cache"]
+        del state["_line_offsets"]
+        del state["_deferred_count"]
+        del state["_deferred_loader"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()  # type: ignore  # Logs pickled before the archive have none of its attributes.
+        self.__dict__.update(state)
+        self.messages = collections.deque(self.messages)  # A list in logs pickled before the archive.
+
+    def __len__(self) -> int:
+        """Return the number of messages ever added, including spilled messages."""
+        return self.spilled_count + self._deferred_count + len(self.messages)
+
+    def defer_older_messages(self, count: int, loader: Callable[[], List[Message]]) -> None:
+        """Leave the `count` in-memory messages older than those in `messages` to be loaded later.
+
+        A loaded game only needs its newest messages to be shown. `loader` is called to get the
+        rest the first time they're needed, such as when the history is browsed.
+        """
+        self._deferred_count = count
+        self._deferred_loader = loader
+
+    def hydrate(self) -> None:
+        """Load the deferred messages, if there are any, in front of the ones in memory."""
+        if self._deferred_loader is None:
+            return
+        older = self._deferred_loader()
+        assert len(older) == self._deferred_count
+        self.messages.extendleft(reversed(older))
+        self._deferred_count = 0
+        self._deferred_loader = None
+        self._line_offsets.clear()
+
+    @property
+    def first_index(self) -> int:
+        """The index of the oldest message which can still be read."""
+        return 0 if self.archive_path else self.spilled_count
+
+    def __getitem__(self, index: int) -> Message:
+        """Return the message at `index`, reading it from the archive if it was spilled."""
+        if index < 0:
+            index += len(self)
+        if not self.first_index <= index < len(self):
+            raise IndexError(index)
+        self.hydrate()
+        if index >= self.spilled_count:
+            return self.messages[index - self.spilled_count]
+        block_index, offset = divmod(index, ARCHIVE_BLOCK_SIZE)
+        return self._read_block(block_index)[offset]
 
     def add_message(
         self, text: str, fg: Tuple[int, int, int] = color.white, *, stack: bool = True,
@@ -36,6 +161,77 @@ class MessageLog:
             self.messages[-1].count += 1
         else:
             self.messages.append(Message(text, fg))
+            if len(self.messages) + self._deferred_count >= self.capacity + ARCHIVE_BLOCK_SIZE:
+                self._spill_block()
+        self.revision += 1
+
+    def _spill_block(self) -> None:
+        """Move the oldest block of messages out of memory, into the archive if there is one."""
+        self.hydrate()
+        block = [self.messages.popleft() for _ in range(ARCHIVE_BLOCK_SIZE)]
+        self.spilled_count += ARCHIVE_BLOCK_SIZE
+        self._line_offsets.clear()  # Offsets are relative to the oldest message in memory.
+        if not self.archive_path:
+            return
+        data = zlib.compress(
+            json.dumps([(m.plain_text, m.fg, m.count) for m in block]).encode("utf-8")
+        )
+        # The first block starts a new archive, replacing any left over from an older game.
+        with open(self.archive_path, "ab" if self.archive_blocks else "wb") as f:
+            f.seek(0, os.SEEK_END)
+            self.archive_blocks.append((f.tell(), len(data)))
+            f.write(data)
+
+    def _read_block(self, block_index: int) -> List[Message]:
+        """Return the messages of an archived block, keeping the last block read in memory."""
+        cached_index, cached_block = self._block_cache
+        if cached_index == block_index:
+            return cached_block
+        offset, length = self.archive_blocks[block_index]
+        with open(self.archive_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        block = []
+        for text, fg, count in json.loads(zlib.decompress(data)):
+            message = Message(text, tuple(fg))
+            message.count = count
+            block.append(message)
+        self._block_cache = (block_index, block)
+        return block
+
+    def view(self, start: int, stop: int) -> MessageRange:
+        """Return the messages from index `start` up to `stop` without copying them."""
+        return MessageRange(self, max(start, self.first_index), min(stop, len(self)))
+
+    def line_offsets(self, width: int) -> List[int]:
+        """Return the cumulative wrapped line counts of the in-memory messages at `width`.
+
+        Item `i` is the number of lines taken by the in-memory messages before message
+        `spilled_count + i`, and the last item is the total.
+        """
+        self.hydrate()
+        offsets = self._line_offsets.setdefault(width, [0])
+        if len(offsets) > 1:
+            offsets.pop()  # The newest message counted may have stacked since, so count it again.
+        for message in itertools.islice(self.messages, len(offsets) - 1, None):
+            offsets.append(offsets[-1] + len(message.wrapped(width)))
+        return offsets
+
+    def seek_line(self, stop: int, width: int, lines: int) -> int:
+        """Return the index of the oldest message needed to fill `lines` lines ending before message `stop`."""
+        offsets = self.line_offsets(width)
+        if stop > self.spilled_count:
+            target = offsets[stop - self.spilled_count] - lines
+            if target >= 0:
+                return self.spilled_count + bisect.bisect_right(offsets, target) - 1
+            lines = -target
+            stop = self.spilled_count
+        # The rest of the window is made of spilled messages, which are counted one at a time.
+        index = stop
+        while lines > 0 and index > self.first_index:
+            index -= 1
+            lines -= len(self[index].wrapped(width))
+        return index
 
     def render(
         self, console: tcod.Console, x: int, y: int, width: int, height: int,
@@ -71,7 +267,7 @@ class MessageLog:
         y_offset = height - 1
 
         for message in reversed(messages):
-            for line in reversed(list(cls.wrap(message.full_text, width))):
+            for line in reversed(message.wrapped(width)):
                 console.print(x=x, y=y + y_offset, string=line, fg=message.fg)
                 y_offset -= 1
                 if y_offset < 0:
@@ -1,8 +1,12 @@
 from __future__ import annotations
-from game_map import GameMap
+import concurrent.futures
+import functools
+import multiprocessing
+from game_map import GameMap, explorable_cells
+from map_chunks import ChunkedLayer
 import tile_types
 import random
-from typing import Dict, Iterator, Tuple, List, TYPE_CHECKING
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple, List, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from engine import Engine
@@ -62,6 +66,7 @@ def get_entities_at_random(
         weighted_chances_by_floor: Dict[int, List[Tuple[Entity, int]]],
         number_of_entities: int,
         floor: int,
+        rng: random.Random,
 ) -> List[Entity]:
     entity_weighted_chances = {}
 
@@ -78,7 +83,7 @@ def get_entities_at_random(
     entities = list(entity_weighted_chances.keys())
     entity_weighted_chance_values = list(entity_weighted_chances.values())
 
-    chosen_entities = random.choices(
+    chosen_entities = rng.choices(
         entities, weights=entity_weighted_chance_values, k=number_of_entities
     )
 
@@ -113,25 +118,36 @@ class RectangularRoom:
                 and self.y2 >= other.y1
         )
 
+    def intersects_any(self, bounds: np.ndarray) -> bool:
+        """Return True if this room overlaps with any of the rooms whose x1, y1, x2, y2 are the rows of `bounds`."""
+        return bool(
+            np.any(
+                (self.x1 <= bounds[:, 2])
+                & (self.x2 >= bounds[:, 0])
+                & (self.y1 <= bounds[:, 3])
+                & (self.y2 >= bounds[:, 1])
+            )
+        )
+
 
-def place_entities(room: RectangularRoom, dungeon: GameMap, floor_number: int, ) -> None:
-    number_of_monsters = random.randint(
+def place_entities(room: RectangularRoom, dungeon: GameMap, floor_number: int, rng: random.Random) -> None:
+    number_of_monsters = rng.randint(
         0, get_max_value_for_floor(max_monsters_by_floor, floor_number)
     )
-    number_of_items = random.randint(
+    number_of_items = rng.randint(
         0, get_max_value_for_floor(max_items_by_floor, floor_number)
     )
 
     monsters: List[Entity] = get_entities_at_random(
-        enemy_chances, number_of_monsters, floor_number
+        enemy_chances, number_of_monsters, floor_number, rng
     )
     items: List[Entity] = get_entities_at_random(
-        item_chances, number_of_items, floor_number
+        item_chances, number_of_items, floor_number, rng
     )
 
     for entity in monsters + items:
-        x = random.randint(room.x1 + 1, room.x2 - 1)
-        y = random.randint(room.y1 + 1, room.y2 - 1)
+        x = rng.randint(room.x1 + 1, room.x2 - 1)
+        y = rng.randint(room.y1 + 1, room.y2 - 1)
 
         if not any(entity.x == x and entity.y == y for existing_entity in dungeon.entities):
             entity.spawn(dungeon, x, y)
@@ -139,12 +155,12 @@ def place_entities(room: RectangularRoom, dungeon: GameMap, floor_number: int, )
 
 # noinspection PyTypeChecker
 def tunnel_between(
-        start: Tuple[int, int], end: Tuple[int, int]
+        start: Tuple[int, int], end: Tuple[int, int], rng: random.Random
 ) -> Iterator[Tuple[int, int]]:
     """Return an L-shaped tunnel between these two points."""
     x1, y1 = start
     x2, y2 = end
-    if random.random() < 0.5:  # 50% chance.
+    if rng.random() < 0.5:  # 50% chance.
         # Move horizontally, then vertically.
         corner_x, corner_y = x2, y1
     else:
@@ -228,140 +244,125 @@ if TYPE_CHECKING:
     from entity import Entity
 
 
-# noinspection PyTypeChecker
-def generate_dungeon(
+class FloorLayout(NamedTuple):
+    """The layout of a generated floor, without a GameMap around it, so that another process can make it."""
+    tile_layout: np.ndarray
+    explorable: np.ndarray
+    start: Tuple[int, int]  # Where the player arrives, in the first room.
+    downstairs_location: Tuple[int, int]
+    upstairs_location: Optional[Tuple[int, int]]
+    generation: Dict[str, Any]  # The arguments it was generated from, the seed included.
+
+
+def generate_layout(
         max_rooms: int,
         room_min_size: int,
         room_max_size: int,
         map_width: int,
         map_height: int,
-        engine: Engine,
-) -> GameMap:
-    """Generate a new dungeon map."""
-    player = engine.player
-    dungeon_map = GameMap(engine, map_width, map_height, entities=[player])
+        upstairs: bool,
+        seed: int,
+) -> FloorLayout:
+    """Generate the layout of a new floor from `seed`, with up stairs where the player arrives if `upstairs` is True.
+
+    This only needs its arguments, so it can run in a worker process, see GameWorld.prefetch_next_floor.
+    Every random choice is drawn from an RNG seeded with `seed`, so the same arguments always
+    generate the same floor, and a floor can be kept as its arguments and its changes since.
+    """
+    generation = {
+        "max_rooms": max_rooms,
+        "room_min_size": room_min_size,
+        "room_max_size": room_max_size,
+        "map_width": map_width,
+        "map_height": map_height,
+        "upstairs": upstairs,
+        "seed": seed,
+    }
+    rng = random.Random(seed)
+    tile_layout = np.full((map_width, map_height), fill_value=1, dtype=np.uint8, order="F")
 
     rooms: List[RectangularRoom] = []
+    bounds = np.empty((max_rooms, 4), dtype=np.int32)  # The x1, y1, x2, y2 of each room, to test overlaps in one go.
     center_of_last_room = (0, 0)
 
     for r in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
+        room_width = rng.randint(room_min_size, room_max_size)
+        room_height = rng.randint(room_min_size, room_max_size)
 
-        x = random.randint(0, dungeon_map.width - room_width - 1)
-        y = random.randint(0, dungeon_map.height - room_height - 1)
+        x = rng.randint(0, map_width - room_width - 1)
+        y = rng.randint(0, map_height - room_height - 1)
 
         # "RectangularRoom" class makes rectangles easier to work with
         new_room = RectangularRoom(x, y, room_width, room_height)
 
         # Run through the other rooms and see if they intersect with this one.
-        if any(new_room.intersects(other_room) for other_room in rooms):
+        if new_room.intersects_any(bounds[:len(rooms)]):
             continue  # This room intersects, so go to the next attempt.
         # If there are no intersections then the room is valid.
 
         # Dig out this rooms inner area.
-        dungeon_map.tile_layout[new_room.inner] = 0
+        tile_layout[new_room.inner] = 0
 
-        if len(rooms) == 0:
-            # The first room, where the player starts.
-            player.place(*new_room.center, dungeon_map)
-        else:  # All rooms after the first.
+        if len(rooms) > 0:  # All rooms after the first.
             # Dig out a tunnel between this room and the previous one.
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                dungeon_map.tile_layout[x, y] = 0
+            for x, y in tunnel_between(rooms[-1].center, new_room.center, rng):
+                tile_layout[x, y] = 0
 
             center_of_last_room = new_room.center
 
         # Spawn Entities TODO
-        # place_entities(new_room, dungeon_map, engine.game_world.current_floor)
-
-        dungeon_map.tiles[center_of_last_room] = tile_types.down_stairs
-        dungeon_map.downstairs_location = center_of_last_room
+        # place_entities(new_room, dungeon_map, engine.game_world.current_floor, rng)
 
         # Finally, append the new room to the list.
 
+        bounds[len(rooms)] = new_room.x1, new_room.y1, new_room.x2, new_room.y2
         rooms.append(new_room)
 
-    '''
-    1. copy tile_layout to explorable
-    2. iterate through tile_layout, and for every 1 (wall), check if there is a floor tile (0) up, down, left, or right.
-    If so, return true
-    '''
-    dungeon_map.explorable = np.select(
-        condlist=[dungeon_map.tile_layout == 0, dungeon_map.tile_layout == 1],
-        choicelist=[True, False],
-        default=False,
-    )
+    start = rooms[0].center
+    return FloorLayout(tile_layout, explorable_cells(tile_layout), start, center_of_last_room, start if upstairs else None, generation)
 
-    for (x, y), t in np.ndenumerate(dungeon_map.tile_layout):
-        # Check if tile is Floor
-        if t == 0:
-            continue
-        # If not
-        if t == 1:
-            # Check up
-            try:
-                if dungeon_map.tile_layout[x, y-1] == 0:
-                    dungeon_map.explorable[x, y] = True
-                    continue
-            except:
-                pass
-
-            # Check Down
-            try:
-                if dungeon_map.tile_layout[x, y+1] == 0:
-                    dungeon_map.explorable[x, y] = True
-                    continue
-            except:
-                pass
-
-            # Check Left
-            try:
-                if dungeon_map.tile_layout[x-1, y] == 0:
-                    dungeon_map.explorable[x, y] = True
-                    continue
-            except:
-                pass
-
-            # Check Right
-            try:
-                if dungeon_map.tile_layout[x+1, y] == 0:
-                    dungeon_map.explorable[x, y] = True
-                    continue
-            except:
-                pass
-
-            # Check Up/Left
-            try:
-                if dungeon_map.tile_layout[x-1, y-1] == 0:
-                    dungeon_map.explorable[x, y] = True
-                    continue
-            except:
-                pass
-
-            # Check Up/Right
-            try:
-                if dungeon_map.tile_layout[x+1, y-1] == 0:
-                    dungeon_map.explorable[x, y] = True
-                    continue
-            except:
-                pass
-
-            # Check Down/Left
-            try:
-                if dungeon_map.tile_layout[x-1, y+1] == 0:
-                    dungeon_map.explorable[x, y] = True
-                    continue
-            except:
-                pass
-
-            # Check Down/Right
-            try:
-                if dungeon_map.tile_layout[x+1, y+1] == 0:
-                    dungeon_map.explorable[x, y] = True
-                    continue
-            except:
-                pass
+
+def build_dungeon(layout: FloorLayout, engine: Engine) -> GameMap:
+    """Return a new dungeon map with the generated `layout`, and put the player at its start."""
+    player = engine.player
+    map_width, map_height = layout.tile_layout.shape
+    dungeon_map = GameMap(engine, map_width, map_height, entities=[player])
+    dungeon_map.tile_layout = layout.tile_layout
+    dungeon_map.explorable = ChunkedLayer.from_array(layout.explorable, fill_value=False)
+    dungeon_map.downstairs_location = layout.downstairs_location
+    dungeon_map.upstairs_location = layout.upstairs_location
+    dungeon_map.generation = layout.generation
+    dungeon_map.generated_layout = layout.tile_layout.copy(order="F")
+    player.place(*layout.start, dungeon_map)
+
+    # The other tiles are only picked once they're drawn.
+    dungeon_map.tiles[dungeon_map.downstairs_location] = tile_types.down_stairs
+    if dungeon_map.upstairs_location is not None:
+        dungeon_map.tiles[dungeon_map.upstairs_location] = tile_types.up_stairs
 
     return dungeon_map
 
+
+# noinspection PyTypeChecker
+def generate_dungeon(
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        map_width: int,
+        map_height: int,
+        engine: Engine,
+        upstairs: bool = False,
+        seed: Optional[int] = None,
+) -> GameMap:
+    """Generate a new dungeon map from `seed`, with up stairs where the player arrives if `upstairs` is True."""
+    if seed is None:
+        seed = random.getrandbits(64)
+    layout = generate_layout(max_rooms, room_min_size, room_max_size, map_width, map_height, upstairs, seed)
+    return build_dungeon(layout, engine)
+
+
+@functools.lru_cache(maxsize=None)
+def generation_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """Return the worker process which generates floor layouts ahead of time."""
+    # Spawned rather than forked, since forking while other threads run can deadlock the child.
+    return concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
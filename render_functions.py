@@ -14,11 +14,19 @@ def get_names_at_location(x: int, y: int, game_map: GameMap) -> str:
     if not game_map.in_bounds(x, y) or not game_map.visible[x, y]:
         return ""
 
-    names = ", ".join(
-        entity.name for entity in game_map.entities if entity.x == x and entity.y == y
-    )
-
-    return names.capitalize()
+    # Entities only change between turns, so names are looked up once per location per turn.
+    if game_map.names_cache_turn != game_map.engine.turn_count:
+        game_map.names_cache.clear()
+        game_map.names_cache_turn = game_map.engine.turn_count
+
+    names = game_map.names_cache.get((x, y))
+    if names is None:
+        names = ", ".join(
+            entity.name for entity in game_map.entities if entity.x == x and entity.y == y
+        ).capitalize()
+        game_map.names_cache[x, y] = names
+
+    return names
 
 
 def render_bar(
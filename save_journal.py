@@ -0,0 +1,303 @@
+"""Incremental saves, as a journal of changes appended to a save file.
+
+The sections of a save file hold a full snapshot of a game, the checkpoint, see savefile. Later
+saves of the same game to the same file only append a record of what changed since the save
+before: the fields of the entities which changed, the layout cells dug out, the newly explored
+cells and the new messages. Loading replays the records over the checkpoint. Once the journal
+has grown bigger than the checkpoint, the next save writes a new checkpoint, which drops it.
+
+Each record is a JOURNAL_RECORD frame, the save's header as uncompressed JSON, so that the list
+of saves can show it without decompressing anything, and the changes as compressed JSON. A record
+cut short by a crash fails its checksum, and loading stops at the intact records before it.
+
+In the journal entities are known by a key rather than a row: the row number in the checkpoint's
+entity tables, or the next unused number for entities which appeared later. Their owners are
+keys too, and their prototype ids and names are stored as strings.
+"""
+from __future__ import annotations
+
+import json
+import os
+import struct
+import zlib
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+from map_chunks import BitMask
+import savefile
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from entity import Entity
+    from game_map import GameMap
+
+JOURNAL_RECORD = struct.Struct("<III")  # Header size, body size, CRC-32 of the header and body.
+
+COMPACT_RATIO = 1.0  # Write a new checkpoint once the journal is this many times the checkpoint's size.
+
+FIELDS = savefile.ENTITY_DTYPE.names
+PROTOTYPE, NAME, OWNER, COLOR = (FIELDS.index(field) for field in ("prototype", "name", "owner", "color"))
+
+Record = Tuple[dict, dict]  # The header and the changes of a journal record.
+
+
+def journal_offset(contents: Dict[str, Tuple[int, int, int]]) -> int:
+    """Return where the journal starts in a save file, right after the last of its sections."""
+    return max((offset + size for offset, size, _ in contents.values()), default=savefile.HEADER.size)
+
+
+def read_records(data: bytes, offset: int) -> Tuple[List[Record], int]:
+    """Return the intact records of the journal starting at `offset` in `data`, and where they end."""
+    records = []
+    while offset + JOURNAL_RECORD.size <= len(data):
+        header_size, body_size, checksum = JOURNAL_RECORD.unpack_from(data, offset)
+        start = offset + JOURNAL_RECORD.size
+        end = start + header_size + body_size
+        if end > len(data) or zlib.crc32(data[start:end]) != checksum:
+            break  # Cut short by a crash while it was being written.
+        header = json.loads(data[start: start + header_size])
+        changes = json.loads(zlib.decompress(data[start + header_size: end]))
+        records.append((header, changes))
+        offset = end
+    return records, offset
+
+
+def last_record_header(f: BinaryIO, offset: int) -> Optional[dict]:
+    """Return the header of the last record of the journal starting at `offset` in `f`, if it has any.
+
+    Only the frames and the last header are read, hopping over the bodies.
+    """
+    size = os.fstat(f.fileno()).st_size
+    last = None
+    while offset + JOURNAL_RECORD.size <= size:
+        f.seek(offset)
+        header_size, body_size, _ = JOURNAL_RECORD.unpack(f.read(JOURNAL_RECORD.size))
+        end = offset + JOURNAL_RECORD.size + header_size + body_size
+        if end > size:
+            break
+        last = offset + JOURNAL_RECORD.size, header_size
+        offset = end
+    if last is None:
+        return None
+    f.seek(last[0])
+    return json.loads(f.read(last[1]))
+
+
+def replay_entities(table: np.ndarray, strings: List[str], records: List[Record]) -> Tuple[np.ndarray, List[int]]:
+    """Return the entity table after the changes of `records`, and the key of each of its rows.
+
+    `table` holds the rows of the checkpoint, whose keys are their row numbers. The rows come out
+    in key order, and `strings` is extended with the strings the new rows refer to.
+    """
+    rows = {}
+    for key, values in enumerate(table.tolist()):
+        row = dict(zip(FIELDS, values))
+        row["prototype"] = strings[row["prototype"]]
+        row["name"] = strings[row["name"]]
+        rows[key] = row
+    for _, changes in records:
+        for key in changes["removed"]:
+            del rows[key]
+        for key, fields in changes["entities"].items():
+            rows.setdefault(int(key), {}).update(fields)
+
+    string_table = savefile.StringTable()
+    for string in strings:
+        string_table.intern(string)
+    keys = sorted(rows)
+    row_of_key = {key: row for row, key in enumerate(keys)}
+    replayed = []
+    for key in keys:
+        row = rows[key]
+        row["prototype"] = string_table.intern(row["prototype"])
+        row["name"] = string_table.intern(row["name"])
+        if row["owner"] != savefile.NO_OWNER:
+            row["owner"] = row_of_key[row["owner"]]
+        replayed.append(tuple(row[field] for field in FIELDS))
+    strings[:] = string_table.strings
+    return np.array(replayed, dtype=savefile.ENTITY_DTYPE), keys
+
+
+def replay_cells(cells: np.ndarray, records: List[Record], layer: str) -> None:
+    """Apply the changes of `records` to a layer of the map, given as its flat cells in Fortran order."""
+    for _, changes in records:
+        changed = changes[layer]
+        if layer == "explored":
+            cells[changed] ^= True  # The cells whose explored flag flipped.
+        else:
+            cells[changed["cells"]] = changed["values"]
+
+
+def replay_messages(recent: List[list], first_index: int, records: List[Record]) -> None:
+    """Apply the message changes of `records` to `recent`, the message records from index `first_index` on."""
+    for _, changes in records:
+        messages = changes["messages"]
+        del recent[messages["start"] - first_index:]  # The last message saved before may have stacked since.
+        recent.extend(messages["records"])
+
+
+class SaveJournal:
+    """Saves a game as a checkpoint or as a journal record, keeping what the last save held to diff against."""
+
+    def __init__(self, compact_ratio: float = COMPACT_RATIO):
+        self.compact_ratio = compact_ratio
+        self.path: Optional[str] = None  # The file saved to last, or None before the first save.
+        self.game_map: Optional[GameMap] = None  # The map saved last, a new floor needs a checkpoint.
+        self.keys: Dict[Entity, int] = {}  # The key of every entity saved since the checkpoint.
+        self.next_key = 0
+        self.rows: Dict[int, tuple] = {}  # The saved row of each entity, by key.
+        self.layout = np.zeros(0, dtype=np.uint8)  # The saved layout, flat in Fortran order.
+        self.explored = BitMask((0, 0))  # The saved explored layer.
+        self.message_count = 0
+        self.spilled_count = 0
+        # Sizes in the file, only updated by the functions which write the saves.
+        self.checkpoint_size = 0
+        self.end = 0  # Where the next record goes.
+
+    def prepare(self, engine: Engine, filename: str) -> Callable[[], None]:
+        """Take what a save of `engine` to `filename` needs, and return the function which writes it.
+
+        The returned function compresses and writes the save, and can be called from another
+        thread while the game goes on. Saves must be written in the order they were prepared, and
+        the next one prepared only once the last one was written or failed.
+        """
+        if self.needs_checkpoint(engine, filename):
+            write = self._prepare_checkpoint(engine, filename)
+        else:
+            write = self._prepare_record(engine, filename)
+
+        def write_or_start_over() -> None:
+            try:
+                write()
+            except BaseException:
+                # What was kept to diff against never reached the file, so the next save is a checkpoint.
+                self.path = None
+                raise
+
+        return write_or_start_over
+
+    def needs_checkpoint(self, engine: Engine, filename: str) -> bool:
+        """Return True if the next save has to be a full checkpoint rather than a record."""
+        return (
+            filename != self.path
+            or engine.game_map is not self.game_map
+            # Spilled messages would have to be dropped from the replayed ones, a checkpoint is simpler.
+            or engine.message_log.spilled_count != self.spilled_count
+            or self.end - self.checkpoint_size > self.checkpoint_size * self.compact_ratio
+        )
+
+    def resume(self, engine: Engine, filename: str, keys: Dict[Entity, int], checkpoint_size: int, end: int) -> None:
+        """Carry on the journal of the file a game was just loaded from.
+
+        `keys` holds the key of each loaded entity. Must be called before the game changes.
+        """
+        self.path = filename
+        self.keys = keys
+        self.next_key = max(keys.values(), default=-1) + 1
+        self.checkpoint_size = checkpoint_size
+        self.end = end
+        self.remember(engine, self.entity_rows(engine))
+
+    def entity_rows(self, engine: Engine, entities: Optional[List[Entity]] = None) -> Dict[int, tuple]:
+        """Return the row of the player, `entities` and the items they carry, by key.
+
+        `entities` are the rest of the map's entities, in the order to give new keys in.
+        """
+        player = engine.player
+        if entities is None:
+            entities = [entity for entity in engine.game_map.entities if entity is not player]
+        strings = savefile.StringTable()
+        ordered: List[Entity] = []
+        table = savefile.entity_table([player, *entities], strings, ordered).tolist()
+
+        rows = {}
+        row_keys: List[int] = []
+        last_item_key: Dict[int, int] = {}  # The key of the last item seen in each owner's inventory.
+        for entity, values in zip(ordered, table):
+            key = self.keys.get(entity)
+            values = list(values)
+            values[PROTOTYPE] = strings.strings[values[PROTOTYPE]]
+            values[NAME] = strings.strings[values[NAME]]
+            values[COLOR] = values[COLOR].tolist()  # tolist leaves the sub-array of colors as an array.
+            if values[OWNER] != savefile.NO_OWNER:
+                owner = values[OWNER] = row_keys[values[OWNER]]
+                # Items are put back into inventories in key order, so an item out of that order,
+                # like one picked up again, gets a new key.
+                if key is not None and key <= last_item_key.get(owner, -1):
+                    key = None
+            if key is None:
+                key = self.keys[entity] = self.next_key
+                self.next_key += 1
+            if values[OWNER] != savefile.NO_OWNER:
+                last_item_key[values[OWNER]] = key
+            row_keys.append(key)
+            rows[key] = tuple(values)
+        return rows
+
+    def remember(self, engine: Engine, rows: Dict[int, tuple]) -> None:
+        """Keep the state of `engine` just saved, for the next save to diff against."""
+        game_map = engine.game_map
+        self.game_map = game_map
+        self.rows = rows
+        self.layout = game_map.tile_layout.astype(np.uint8).ravel(order="F")
+        self.explored = BitMask.from_array(game_map.explored.to_array())
+        self.message_count = len(engine.message_log)
+        self.spilled_count = engine.message_log.spilled_count
+
+    def _prepare_checkpoint(self, engine: Engine, filename: str) -> Callable[[], None]:
+        entities = [entity for entity in engine.game_map.entities if entity is not engine.player]
+        sections = savefile.snapshot_sections(engine, entities)
+        self.path = filename
+        self.keys = {}
+        self.next_key = 0
+        self.remember(engine, self.entity_rows(engine, entities))  # Keys follow the checkpoint's rows.
+
+        def write() -> None:
+            data = savefile.pack_sections(sections)
+            savefile.write_save(filename, data)
+            self.checkpoint_size = self.end = len(data)
+
+        return write
+
+    def _prepare_record(self, engine: Engine, filename: str) -> Callable[[], None]:
+        rows = self.entity_rows(engine)
+        entity_changes = {}
+        for key, row in rows.items():
+            saved = self.rows.get(key)
+            if saved is None:
+                entity_changes[key] = dict(zip(FIELDS, row))
+            elif saved != row:
+                entity_changes[key] = {FIELDS[i]: value for i, (value, old) in enumerate(zip(row, saved)) if value != old}
+
+        game_map = engine.game_map
+        layout = game_map.tile_layout.astype(np.uint8).ravel(order="F")
+        explored = BitMask.from_array(game_map.explored.to_array())
+        dug = np.flatnonzero(layout != self.layout)
+        message_log = engine.message_log
+        start = max(self.message_count - 1, 0)
+        changes = {
+            "turn_count": engine.turn_count,
+            "entities": entity_changes,
+            "removed": [key for key in self.rows if key not in rows],
+            "layout": {"cells": dug.tolist(), "values": layout[dug].tolist()},
+            "explored": (explored ^ self.explored).flatnonzero().tolist(),
+            "messages": {
+                "start": start,
+                "records": [[m.plain_text, m.fg, m.count] for m in message_log.view(start, len(message_log))],
+                "revision": message_log.revision,
+            },
+        }
+        header = json.dumps(savefile.save_header(engine)).encode("utf-8")
+        self.remember(engine, rows)
+
+        def write() -> None:
+            body = zlib.compress(json.dumps(changes).encode("utf-8"), savefile.COMPRESSION_LEVEL)
+            record = JOURNAL_RECORD.pack(len(header), len(body), zlib.crc32(header + body)) + header + body
+            with open(filename, "r+b") as f:
+                f.seek(self.end)  # Past the last intact record, over any left by a crash.
+                f.write(record)
+                f.truncate()
+            self.end += len(record)
+
+        return write
@@ -0,0 +1,99 @@
+"""The save slots in the save directory, and an index of their headers for the main menu.
+
+Each game saves to its own slot file in SAVE_DIR. The index file keeps a copy of every slot's
+header, along with the size and modification time of the file it was read from. Listing the
+slots only reads the header of the slots changed since the index was written, so the menu can
+list many saves without loading any of them.
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+import savefile
+
+SAVE_DIR = "saves"
+INDEX_FILE = "index.json"
+LEGACY_SAVE = "savegame.sav"  # Where saves were kept before there were slots.
+
+
+class SlotInfo(NamedTuple):
+    path: str
+    header: Optional[dict]  # The save's header, or None for saves made before headers existed.
+    saved_at: float  # When the slot was last saved, as a POSIX timestamp.
+
+    @property
+    def name(self) -> str:
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def describe(self) -> str:
+        """Return a one line summary of this slot for the menu."""
+        saved_at = datetime.datetime.fromtimestamp(self.saved_at).strftime("%Y-%m-%d %H:%M")
+        if self.header is None:
+            return f"{self.name}: an older save, {saved_at}"
+        header = self.header
+        return (
+            f"{self.name}: Level {header['level']}, floor {header['floor']},"
+            f" HP {header['hp']}/{header['max_hp']}, turn {header['turn_count']}, {saved_at}"
+        )
+
+
+class SaveSlots:
+    """The save slots in `directory`, newest first."""
+
+    def __init__(self, directory: str = SAVE_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE)
+
+    def list(self) -> List[SlotInfo]:
+        """Return every save slot, most recently saved first, and bring the index up to date."""
+        index = self._read_index()
+        paths = []
+        if os.path.isdir(self.directory):
+            paths = [entry.path for entry in os.scandir(self.directory) if entry.name.endswith(".sav")]
+        if os.path.exists(LEGACY_SAVE):
+            paths.append(LEGACY_SAVE)
+
+        slots = []
+        new_index = {}
+        for path in paths:
+            stat = os.stat(path)
+            entry = index.get(path)
+            if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                try:
+                    header = savefile.read_header(path)
+                except (OSError, ValueError, savefile.SaveFormatError):
+                    continue  # Unreadable, or from a newer version of the game.
+                entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "header": header}
+            new_index[path] = entry
+            header = entry["header"]
+            saved_at = header["saved_at"] if header else stat.st_mtime
+            slots.append(SlotInfo(path, header, saved_at))
+
+        if new_index != index and os.path.isdir(self.directory):
+            self._write_index(new_index)
+        slots.sort(key=lambda slot: slot.saved_at, reverse=True)
+        return slots
+
+    def new_slot_path(self) -> str:
+        """Return the path of a slot which isn't used yet, for a new game."""
+        os.makedirs(self.directory, exist_ok=True)
+        number = 1
+        while os.path.exists(os.path.join(self.directory, f"slot{number}.sav")):
+            number += 1
+        return os.path.join(self.directory, f"slot{number}.sav")
+
+    def _read_index(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}  # A missing or damaged index is rebuilt from the slots' headers.
+
+    def _write_index(self, index: Dict[str, dict]) -> None:
+        temporary = f"{self.index_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(temporary, self.index_path)
@@ -0,0 +1,751 @@
+"""The binary save format.
+
+A save file starts with a small header and a table of contents, followed by independently
+compressed sections:
+
+- "header": JSON with a summary of the game for the list of saves, stored uncompressed and
+  first so that it can be read without touching the rest of the file.
+- "world": JSON with the game world settings, the turn count and the size of each table.
+- "strings": JSON list of the prototype ids and names the entity tables refer to.
+- "player": a column table of the player and the items they carry, see ENTITY_DTYPE.
+- "layout": the floor layout of the current map, as raw uint8 cells in Fortran order.
+- "explored": the explored layer of the current map, as the bits of a map_chunks.BitMask.
+- "entities": a column table of the other entities on the current map.
+- "message_log": JSON with the message log's settings and its newest messages.
+- "older_messages": JSON list of the rest of the messages held in memory.
+- "floor:N": floor N, for every other floor the player has visited, packed by `pack_floor`.
+
+A packed floor is itself in this format, with "floor" JSON holding its size and stairs, and its
+own "strings", "explored" and "entities". A floor generated from a recorded seed keeps the
+arguments it was generated from in "floor", and "layout_changes" holds the cells of its layout
+which differ from the generated one, such as dug tiles, so that its layout is generated again
+rather than stored. "floor" also holds a checksum of the generated layout, so that a floor
+generated differently by another version of the game fails to unpack rather than changing. Other
+floors, and the current floor, store their whole "layout". A packed floor is stored as it is,
+since its sections are compressed already.
+
+Loading only decodes what the first frame needs. The older messages are left to a worker thread,
+and the other floors stay packed in the floor cache until the player goes back to them. Save
+files are read through a memory map, so only the sections read are paged in, and the layout is
+decompressed in chunks straight into its array.
+
+The sections may be followed by a journal of the changes made since they were written, which is
+replayed over them on load, see save_journal.
+
+Anything which can be derived from these is left out and rebuilt on load: the tile graphics and
+walkability come from the layout, the explorable layer from the layout, and the visible layer
+from a fresh field of view. Entities are rebuilt from their prototype in entity_factories, so
+only the fields which change during a game are stored.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import functools
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+from map_chunks import BitMask, ChunkedLayer
+from render_order import RenderOrder
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from entity import Actor, Entity
+    from game_map import GameMap
+    from message_log import Message
+
+MAGIC = b"ROTASAVE"
+FORMAT_VERSION = 7  # 2 added the "header" section, 3 split out the player and older messages,
+# 4 added the journal, 5 packed the explored layer into bits, 6 added up stairs and other floors,
+# 7 kept floors as the seed they were generated from and their changes.
+
+HEADER = struct.Struct("<8sHH")  # Magic, format version, number of sections.
+SECTION_ENTRY = struct.Struct("<16sQQQ")  # Name, offset, compressed size, raw size.
+
+COMPRESSION_LEVEL = 6
+RAW_SECTIONS = {"header"}  # Sections stored without compression, along with the packed floors.
+FLOOR_SECTION = "floor:"  # The prefix of the name of each packed floor's section.
+
+# A section's data, or a function returning it, for a section which is only packed when the save is written.
+Section = Union[bytes, Callable[[], bytes]]
+
+RECENT_MESSAGES = 50  # Messages loaded with the rest of a game, the older ones are loaded later.
+STREAM_CHUNK = 256 * 1024  # Most bytes decompressed at once when a section is streamed into an array.
+
+# AI kinds, for the "ai" and "previous_ai" columns.
+AI_NONE = 0
+AI_HOSTILE = 1
+AI_CONFUSED = 2
+
+# Equipment slots, for the "equipped" column.
+SLOTS = {1: "weapon", 2: "armor"}
+
+NO_OWNER = -1  # The "owner" of an entity lying on the map, rather than in an inventory.
+
+RENDER_ORDERS = {order.value: order for order in RenderOrder}  # Much faster than calling RenderOrder.
+
+ENTITY_DTYPE = np.dtype(
+    [
+        ("prototype", "<u2"),  # Index of the prototype id in the string table.
+        ("name", "<u2"),  # Index of the name in the string table.
+        ("x", "<i4"),
+        ("y", "<i4"),
+        ("owner", "<i4"),  # Row of the actor carrying this item, or NO_OWNER.
+        ("equipped", "u1"),  # Key of SLOTS the item is equipped to, or 0.
+        ("char", "<u4"),  # Codepoint of the glyph.
+        ("color", "u1", 3),
+        ("blocks_movement", "?"),
+        ("render_order", "u1"),
+        ("ai", "u1"),
+        ("previous_ai", "u1"),  # The AI a confused actor returns to.
+        ("ai_turns", "<i4"),  # Turns of confusion left.
+        ("hp", "<i4"),
+        ("max_hp", "<i4"),
+        ("base_defense", "<i4"),
+        ("base_power", "<i4"),
+        ("current_level", "<i4"),
+        ("current_xp", "<i4"),
+    ]
+)
+
+
+class SaveFormatError(Exception):
+    """Raised when a file isn't a save in this format, or is from a newer version of the game."""
+
+
+def is_save_file(data: bytes) -> bool:
+    """Return True if `data` starts like a save in this format."""
+    return data[: len(MAGIC)] == MAGIC
+
+
+def is_raw_section(name: str) -> bool:
+    return name in RAW_SECTIONS or name.startswith(FLOOR_SECTION)
+
+
+def pack_sections(sections: Dict[str, Section]) -> bytes:
+    """Return `sections` compressed and joined behind a header and a table of contents."""
+    sections = {name: data() if callable(data) else data for name, data in sections.items()}
+    stored = {
+        name: data if is_raw_section(name) else zlib.compress(data, COMPRESSION_LEVEL)
+        for name, data in sections.items()
+    }
+    offset = HEADER.size + SECTION_ENTRY.size * len(sections)
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, len(sections))]
+    for name, data in stored.items():
+        parts.append(SECTION_ENTRY.pack(name.encode("ascii"), offset, len(data), len(sections[name])))
+        offset += len(data)
+    parts.extend(stored.values())
+    return b"".join(parts)
+
+
+def read_table_of_contents(data: bytes) -> Dict[str, Tuple[int, int, int]]:
+    """Return the (offset, stored size, raw size) of each section of a save.
+
+    `data` only needs to hold the start of the file, up to the end of the table of contents.
+    """
+    magic, version, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise SaveFormatError("Not a save file.")
+    if version > FORMAT_VERSION:
+        raise SaveFormatError(f"The save is from a newer version of the game (format {version}).")
+    contents = {}
+    for i in range(count):
+        name, offset, size, raw_size = SECTION_ENTRY.unpack_from(data, HEADER.size + SECTION_ENTRY.size * i)
+        contents[name.rstrip(b"\0").decode("ascii")] = offset, size, raw_size
+    return contents
+
+
+def read_header(filename: str) -> Optional[Dict[str, Any]]:
+    """Return the "header" section of a save file, reading only the start of the file.
+
+    If the save has a journal, the header of its last record is returned instead. Returns None for
+    saves without a header, such as pickled saves from older versions.
+    """
+    import save_journal
+
+    with open(filename, "rb") as f:
+        start = f.read(HEADER.size)
+        if not is_save_file(start):
+            return None
+        _, _, count = HEADER.unpack(start)
+        contents = read_table_of_contents(start + f.read(SECTION_ENTRY.size * count))
+        if "header" not in contents:
+            return None
+        header = save_journal.last_record_header(f, save_journal.journal_offset(contents))
+        if header is not None:
+            return header
+        offset, size, _ = contents["header"]
+        f.seek(offset)
+        return json.loads(f.read(size))
+
+
+def pack_columns(table: np.ndarray) -> bytes:
+    """Return the columns of a structured array one after another, which compresses better than rows."""
+    return b"".join(np.ascontiguousarray(table[name]).tobytes() for name in table.dtype.names)
+
+
+def unpack_columns(data: bytes, dtype: np.dtype, count: int) -> np.ndarray:
+    """Return the structured array stored by `pack_columns`."""
+    table = np.zeros(count, dtype=dtype)
+    offset = 0
+    for name in dtype.names:
+        column = table[name]
+        column[...] = np.frombuffer(data, dtype=column.dtype, count=column.size, offset=offset).reshape(column.shape)
+        offset += column.nbytes
+    return table
+
+
+def prototype_of(entity: Entity) -> str:
+    """Return the id of the prototype `entity` was copied from.
+
+    Entities from saves made before prototype ids existed are matched to a prototype by name.
+    """
+    import entity_factories
+
+    if entity.prototype_id is not None:
+        return entity.prototype_id
+    name = entity.name
+    if name.startswith("remains of "):
+        name = name[len("remains of "):]
+    for prototype_id, prototype in entity_factories.PROTOTYPES.items():
+        if prototype.name == name and type(prototype) is type(entity):
+            return prototype_id
+    raise SaveFormatError(f"Can't save {entity.name!r}, it doesn't come from a known prototype.")
+
+
+def ai_kind(ai: object) -> Tuple[int, int, int]:
+    """Return the (ai, previous_ai, ai_turns) columns for an actor's AI."""
+    from components.ai import ConfusedEnemy
+
+    if ai is None:
+        return AI_NONE, AI_NONE, 0
+    if isinstance(ai, ConfusedEnemy):
+        previous = ai.previous_ai
+        while isinstance(previous, ConfusedEnemy):  # Confused again while confused.
+            previous = previous.previous_ai
+        return AI_CONFUSED, AI_NONE if previous is None else AI_HOSTILE, ai.turns_remaining
+    return AI_HOSTILE, AI_NONE, 0
+
+
+class StringTable:
+    """The strings the entity tables of a save refer to by index."""
+
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def intern(self, string: str) -> int:
+        """Return the index of `string`, adding it to the table if it's new."""
+        if string not in self.index:
+            self.index[string] = len(self.strings)
+            self.strings.append(string)
+        return self.index[string]
+
+
+def entity_table(entities: Iterable[Entity], strings: StringTable, saved: Optional[List[Entity]] = None) -> np.ndarray:
+    """Return the entity column table of `entities` and the items they carry.
+
+    Items carried by an actor come right after it, with that actor's row as their owner. If given,
+    `saved` is extended with the entity of each row.
+    """
+    from entity import Actor
+
+    rows: List[Tuple[Entity, int, int]] = []  # Entity, owner row, equipped slot.
+    for entity in entities:
+        owner = len(rows)
+        rows.append((entity, NO_OWNER, 0))
+        if isinstance(entity, Actor):
+            equipment = entity.equipment
+            for item in entity.inventory.items:
+                slot = 1 if equipment.weapon is item else 2 if equipment.armor is item else 0
+                rows.append((item, owner, slot))
+    if saved is not None:
+        saved.extend(entity for entity, _, _ in rows)
+
+    # Rows are gathered as tuples in ENTITY_DTYPE's field order, then converted in one go.
+    records = []
+    for entity, owner, slot in rows:
+        if isinstance(entity, Actor):
+            ai, previous_ai, ai_turns = ai_kind(entity.ai)
+            fighter = entity.fighter
+            stats = (
+                ai, previous_ai, ai_turns,
+                fighter.hp, fighter.max_hp, fighter.base_defense, fighter.base_power,
+                entity.level.current_level, entity.level.current_xp,
+            )
+        else:
+            stats = (AI_NONE, AI_NONE, 0, 0, 0, 0, 0, 0, 0)
+        records.append(
+            (
+                strings.intern(prototype_of(entity)), strings.intern(entity.name), entity.x, entity.y,
+                owner, slot, ord(entity.char), entity.color, entity.blocks_movement, entity.render_order.value,
+            )
+            + stats
+        )
+    return np.array(records, dtype=ENTITY_DTYPE)
+
+
+def restore_entities(table: np.ndarray, strings: List[str]) -> Tuple[List[Entity], List[Entity]]:
+    """Return every entity of an entity table by row, and the ones which aren't carried.
+
+    Carried items are put in their owner's inventory.
+    """
+    from entity import Actor
+
+    # Plain Python rows, since reading numpy scalars one field at a time is slow.
+    rows = [dict(zip(ENTITY_DTYPE.names, values)) for values in table.tolist()]
+    entities = [restore_entity(row, strings) for row in rows]
+    roots = []
+    for entity, row in zip(entities, rows):
+        if row["owner"] == NO_OWNER:
+            roots.append(entity)
+            continue
+        owner: Actor = entities[row["owner"]]  # type: ignore
+        entity.parent = owner.inventory
+        owner.inventory.items.append(entity)  # type: ignore
+        if row["equipped"]:
+            owner.equipment.equip_to_slot(SLOTS[row["equipped"]], entity, add_message=False)  # type: ignore
+    return entities, roots
+
+
+@functools.lru_cache(maxsize=None)
+def pickled_prototype(prototype_id: str) -> bytes:
+    """Return a prototype pickled, copies are unpickled from it much faster than a deepcopy makes them."""
+    import entity_factories
+
+    return pickle.dumps(entity_factories.PROTOTYPES[prototype_id], protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def restore_entity(row: Dict[str, Any], strings: List[str]) -> Entity:
+    """Return a new entity made from its prototype and its row of the entity table."""
+    from components.ai import ConfusedEnemy, HostileEnemy
+    from entity import Actor
+
+    entity = pickle.loads(pickled_prototype(strings[row["prototype"]]))
+    entity.name = strings[row["name"]]
+    entity.x = row["x"]
+    entity.y = row["y"]
+    entity.char = chr(row["char"])
+    entity.color = tuple(row["color"])
+    entity.blocks_movement = row["blocks_movement"]
+    entity.render_order = RENDER_ORDERS[row["render_order"]]
+    if isinstance(entity, Actor):
+        # The AI goes first, so that setting the hp of a dead actor doesn't make it die again.
+        if row["ai"] == AI_NONE:
+            entity.ai = None
+        else:
+            entity.ai = HostileEnemy(entity)
+            if row["ai"] == AI_CONFUSED:
+                entity.ai = ConfusedEnemy(
+                    entity,
+                    previous_ai=entity.ai if row["previous_ai"] == AI_HOSTILE else None,
+                    turns_remaining=row["ai_turns"],
+                )
+        entity.fighter.max_hp = row["max_hp"]
+        entity.fighter.hp = row["hp"]
+        entity.fighter.base_defense = row["base_defense"]
+        entity.fighter.base_power = row["base_power"]
+        entity.level.current_level = row["current_level"]
+        entity.level.current_xp = row["current_xp"]
+    return entity
+
+
+def save_engine(engine: Engine) -> bytes:
+    """Return the save data of `engine`."""
+    return pack_sections(snapshot_sections(engine))
+
+
+def save_header(engine: Engine) -> Dict[str, Any]:
+    """Return the summary of `engine` shown in the list of saves."""
+    player = engine.player
+    return {
+        "level": player.level.current_level,
+        "floor": engine.game_world.current_floor,
+        "hp": player.fighter.hp,
+        "max_hp": player.fighter.max_hp,
+        "turn_count": engine.turn_count,
+        "saved_at": time.time(),
+    }
+
+
+def snapshot_sections(engine: Engine, entities: Optional[List[Entity]] = None) -> Dict[str, Section]:
+    """Return the uncompressed sections of a save of `engine`.
+
+    `entities` are the map's entities other than the player, in the order to save them, and
+    default to all of them. The sections are copies which share nothing with the game, so they
+    can be compressed and written by another thread while the game goes on. Floors which are only
+    held live are left as functions packing their snapshot, which pack_sections calls.
+    """
+    game_map = engine.game_map
+    game_world = engine.game_world
+    message_log = engine.message_log
+    player = engine.player
+    message_log.hydrate()
+    if entities is None:
+        entities = [entity for entity in game_map.entities if entity is not player]
+
+    strings = StringTable()
+    player_table = entity_table([player], strings)
+    entity_rows = entity_table(entities, strings)
+    world = {
+        "map_width": game_world.map_width,
+        "map_height": game_world.map_height,
+        "max_rooms": game_world.max_rooms,
+        "room_min_size": game_world.room_min_size,
+        "room_max_size": game_world.room_max_size,
+        "current_floor": game_world.current_floor,
+        "turn_count": engine.turn_count,
+        **floor_info(game_map),
+        "player_count": len(player_table),
+        "entity_count": len(entity_rows),
+        "floors": game_world.floors.floors(),
+    }
+    messages = [(m.plain_text, m.fg, m.count) for m in message_log.messages]
+    recent_count = min(len(messages), RECENT_MESSAGES)
+    log = {
+        "capacity": message_log.capacity,
+        "archive_path": message_log.archive_path,
+        "spilled_count": message_log.spilled_count,
+        "archive_blocks": message_log.archive_blocks,
+        "revision": message_log.revision,
+        "older_count": len(messages) - recent_count,
+        "recent": messages[len(messages) - recent_count:],
+    }
+    return {
+        "header": json.dumps(save_header(engine)).encode("utf-8"),
+        "world": json.dumps(world).encode("utf-8"),
+        "strings": json.dumps(strings.strings).encode("utf-8"),
+        "player": pack_columns(player_table),
+        **floor_layers(game_map),
+        "entities": pack_columns(entity_rows),
+        "message_log": json.dumps(log).encode("utf-8"),
+        "older_messages": json.dumps(messages[: len(messages) - recent_count]).encode("utf-8"),
+        **{f"{FLOOR_SECTION}{floor}": game_world.floors.snapshot(floor) for floor in world["floors"]},
+    }
+
+
+def floor_info(game_map: GameMap) -> Dict[str, Any]:
+    """Return the size and the stairs of a floor, and what it was generated from."""
+    return {
+        "width": game_map.width,
+        "height": game_map.height,
+        "downstairs_location": game_map.downstairs_location,
+        "upstairs_location": game_map.upstairs_location,
+        "generation": game_map.generation,
+    }
+
+
+def layout_checksum(layout: np.ndarray) -> int:
+    """Return the CRC-32 of a layout's cells in Fortran order."""
+    return zlib.crc32(layout.astype(np.uint8).tobytes(order="F"))
+
+
+def regenerate_layout(generation: Dict[str, Any]) -> np.ndarray:
+    """Return the layout generated from `generation`, the arguments of procgen.generate_layout."""
+    from procgen import generate_layout
+
+    return generate_layout(**generation).tile_layout
+
+
+def floor_layers(game_map: GameMap) -> Dict[str, bytes]:
+    """Return the "layout" and "explored" sections of a floor."""
+    return {
+        "layout": game_map.tile_layout.astype(np.uint8).tobytes(order="F"),
+        "explored": BitMask.from_array(game_map.explored.to_array()).tobytes(),
+    }
+
+
+def read_floor(save: SaveReader, engine: Engine, info: Dict[str, Any]) -> GameMap:
+    """Return a new GameMap with the layers of `save` and the size and stairs of `info`.
+
+    The derived layers are left for the caller to rebuild, once it has made any changes.
+    """
+    from game_map import GameMap
+
+    shape = info["width"], info["height"]
+    generated = None
+    if "layout_changes" in save:
+        generated = regenerate_layout(info["generation"])
+        if layout_checksum(generated) != info["layout_checksum"]:
+            raise SaveFormatError("A floor of the save was generated by a different version of the game.")
+        layout = generated.copy(order="F")
+        changes = save.section("layout_changes")
+        count = info["change_count"]
+        cells = np.frombuffer(changes, dtype="<u4", count=count)
+        layout.ravel(order="F")[cells] = np.frombuffer(changes, dtype=np.uint8, offset=cells.nbytes)
+    else:
+        layout = save.read_array("layout", np.uint8, shape)
+    game_map = GameMap(engine, *shape, tile_layout=layout)
+    game_map.generated_layout = generated
+    if save.version >= 5:
+        explored = BitMask.from_bytes(save.section("explored"), shape).to_array()
+    else:  # Format 4 and older stored a byte per explored cell.
+        explored = np.frombuffer(save.section("explored"), dtype=bool).reshape(shape, order="F")
+    game_map.explored = ChunkedLayer.from_array(explored, fill_value=False)
+    game_map.downstairs_location = tuple(info["downstairs_location"])
+    if info.get("upstairs_location") is not None:
+        game_map.upstairs_location = tuple(info["upstairs_location"])
+    game_map.generation = info.get("generation")
+    return game_map
+
+
+def pack_floor(game_map: GameMap, engine: Engine) -> bytes:
+    """Return a floor the player isn't on packed into a compressed container of its own sections.
+
+    A floor with a recorded generation is packed as the changes to its generated layout.
+    """
+    return snapshot_floor(game_map, engine)()
+
+
+def snapshot_floor(game_map: GameMap, engine: Engine) -> Callable[[], bytes]:
+    """Return a function packing a floor as it is now, like pack_floor, which any thread can call.
+
+    Only the entities and layers are copied here. Diffing the layout, and generating it again if
+    it wasn't kept, are left to the function along with compressing.
+    """
+    strings = StringTable()
+    entities = entity_table((entity for entity in game_map.entities if entity is not engine.player), strings)
+    return functools.partial(
+        pack_floor_snapshot,
+        {**floor_info(game_map), "entity_count": len(entities)},
+        strings.strings,
+        entities,
+        game_map.tile_layout.astype(np.uint8, order="F"),
+        BitMask.from_array(game_map.explored.to_array()),
+        game_map.generated_layout,
+    )
+
+
+def pack_floor_snapshot(
+        info: Dict[str, Any],
+        strings: List[str],
+        entities: np.ndarray,
+        layout: np.ndarray,
+        explored: BitMask,
+        generated: Optional[np.ndarray],
+) -> bytes:
+    """Return the floor taken by snapshot_floor packed, see pack_floor."""
+    layers = {"layout": layout.tobytes(order="F"), "explored": explored.tobytes()}
+    if info["generation"] is not None:
+        cells = layout.ravel(order="F")
+        if generated is None:  # Loaded with its whole layout.
+            generated = regenerate_layout(info["generation"])
+        changed = np.flatnonzero(cells != generated.ravel(order="F"))
+        info["change_count"] = len(changed)
+        info["layout_checksum"] = layout_checksum(generated)
+        del layers["layout"]
+        layers["layout_changes"] = changed.astype("<u4").tobytes() + cells[changed].tobytes()
+    return pack_sections(
+        {
+            "floor": json.dumps(info).encode("utf-8"),
+            "strings": json.dumps(strings).encode("utf-8"),
+            **layers,
+            "entities": pack_columns(entities),
+        }
+    )
+
+
+def unpack_floor(data: bytes, engine: Engine) -> GameMap:
+    """Return the GameMap packed by `pack_floor`."""
+    save = SaveReader(data)
+    info = save.json("floor")
+    strings = save.json("strings")
+    game_map = read_floor(save, engine, info)
+    game_map.rebuild_derived_layers()
+    _, entities = restore_entities(unpack_columns(save.section("entities"), ENTITY_DTYPE, info["entity_count"]), strings)
+    for entity in entities:
+        entity.parent = game_map
+        game_map.entities.add(entity)
+    return game_map
+
+
+def write_save(filename: str, data: bytes) -> None:
+    """Write save data to `filename` through a temporary file, so a crash never leaves half a save."""
+    temporary = f"{filename}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, filename)
+
+
+def decode_section(name: str, stored: bytes) -> bytes:
+    """Return the data of the section `name`, from its `stored` bytes."""
+    return stored if is_raw_section(name) else zlib.decompress(stored)
+
+
+def decompressed_chunks(stored: bytes) -> Iterator[bytes]:
+    """Yield the data of a compressed section at most STREAM_CHUNK bytes at a time."""
+    decompressor = zlib.decompressobj()
+    while stored:
+        yield decompressor.decompress(stored, STREAM_CHUNK)
+        stored = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+class SaveReader:
+    """Reads the sections of save data one at a time, only decompressing the ones asked for.
+
+    `data` can be a memory map of a save file. Sections are copied out of it as they're read, so
+    nothing keeps the map open once the reader is done with.
+    """
+
+    def __init__(self, data: Union[bytes, mmap.mmap]):
+        self.data = data
+        self.contents = read_table_of_contents(data)
+        self.version = HEADER.unpack_from(data, 0)[1]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.contents
+
+    def stored(self, name: str) -> bytes:
+        """Return a section as it's stored, compressed unless it's a raw section."""
+        offset, size, _ = self.contents[name]
+        return self.data[offset: offset + size]
+
+    def section(self, name: str) -> bytes:
+        return decode_section(name, self.stored(name))
+
+    def json(self, name: str) -> Any:
+        return json.loads(self.section(name))
+
+    def read_array(self, name: str, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+        """Return a section holding the cells of an array in Fortran order, as a new array.
+
+        A compressed section is decompressed in chunks straight into the array, so that the
+        decompressed section is never held in full next to it.
+        """
+        array = np.empty(shape, dtype=dtype, order="F")
+        cells = array.reshape(-1, order="F").view(np.uint8)
+        stored = self.stored(name)
+        chunks = [stored] if is_raw_section(name) else decompressed_chunks(stored)
+        position = 0
+        for chunk in chunks:
+            if position + len(chunk) > cells.size:
+                raise SaveFormatError(f"The {name!r} section is bigger than its array.")
+            cells[position: position + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+            position += len(chunk)
+        if position != cells.size:
+            raise SaveFormatError(f"The {name!r} section is smaller than its array.")
+        return array
+
+
+def messages_from_records(records: List[list]) -> List[Message]:
+    """Return the messages of a list of (text, fg, count) records."""
+    from message_log import Message
+
+    messages = []
+    for text, fg, count in records:
+        message = Message(text, tuple(fg))
+        message.count = count
+        messages.append(message)
+    return messages
+
+
+@functools.lru_cache(maxsize=None)
+def background_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Return the worker thread which decodes the deferred sections of loaded saves."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="save-hydration")
+
+
+def load_engine(data: Union[bytes, mmap.mmap], filename: Optional[str] = None) -> Engine:
+    """Return the Engine saved in `data`, with its journal replayed.
+
+    Only what the first frame needs is decoded before returning: the world, the player and the
+    current floor. The older messages are decoded by a worker thread, and handed to the message
+    log the first time it needs them. The other floors are only unpacked when they're visited.
+    If `filename` is the file `data` was read from, the next
+    save of the game can append to its journal rather than write a new checkpoint.
+    """
+    from engine import Engine
+    from game_map import GameWorld
+    from message_log import MessageLog
+    import save_journal
+
+    save = SaveReader(data)
+    world = save.json("world")
+    strings = save.json("strings")
+    records: List[save_journal.Record] = []
+    journal_start = journal_end = save_journal.journal_offset(save.contents)
+    if save.version >= 4:
+        records, journal_end = save_journal.read_records(data, journal_start)
+
+    if "player" in save:
+        # The player's table and the floor's table are replayed as one, keyed by their rows.
+        player_table = unpack_columns(save.section("player"), ENTITY_DTYPE, world["player_count"])
+        floor_table = unpack_columns(save.section("entities"), ENTITY_DTYPE, world["entity_count"])
+        carried = floor_table["owner"] != NO_OWNER
+        floor_table["owner"][carried] += len(player_table)
+        table = np.concatenate([player_table, floor_table])
+        keys = list(range(len(table)))
+        if records:
+            table, keys = save_journal.replay_entities(table, strings, records)
+        entities, floor_entities = restore_entities(table, strings)
+        player = entities[0]  # The player always has the first key.
+        floor_entities.remove(player)
+    else:  # Format 1 and 2 kept the player in the floor's table.
+        table = unpack_columns(save.section("entities"), ENTITY_DTYPE, world["entity_count"])
+        entities, floor_entities = restore_entities(table, strings)
+        player = entities[world["player"]]
+        floor_entities.remove(player)
+
+    engine = Engine(player=player)  # type: ignore
+    engine.turn_count = records[-1][1]["turn_count"] if records else world["turn_count"]
+
+    if "message_log" in save:
+        log = save.json("message_log")
+        recent_records = log["recent"]
+        save_journal.replay_messages(recent_records, log["spilled_count"] + log["older_count"], records)
+        recent = messages_from_records(recent_records)
+    else:  # Format 1 and 2 kept every in-memory message in one section.
+        log = save.json("messages")
+        recent = messages_from_records(log["messages"])
+    message_log = MessageLog(capacity=log["capacity"], archive_path=log["archive_path"])
+    message_log.spilled_count = log["spilled_count"]
+    message_log.archive_blocks = [(offset, length) for offset, length in log["archive_blocks"]]
+    message_log.revision = records[-1][1]["messages"]["revision"] if records else log["revision"]
+    message_log.messages.extend(recent)
+    if log.get("older_count"):
+        # The worker gets a copy of the section, as `data` may be a memory map closed once this returns.
+        stored = save.stored("older_messages")
+        older = background_executor().submit(
+            lambda: messages_from_records(json.loads(decode_section("older_messages", stored)))
+        )
+        message_log.defer_older_messages(log["older_count"], older.result)
+    engine.message_log = message_log
+
+    engine.game_world = GameWorld(
+        engine=engine,
+        map_width=world["map_width"],
+        map_height=world["map_height"],
+        max_rooms=world["max_rooms"],
+        room_min_size=world["room_min_size"],
+        room_max_size=world["room_max_size"],
+        current_floor=world["current_floor"],
+    )
+
+    for floor in world.get("floors", []):
+        engine.game_world.floors.add_packed(floor, save.section(f"{FLOOR_SECTION}{floor}"))
+
+    game_map = read_floor(save, engine, world)
+    # Flattened in Fortran order, the layers are views of the same cells.
+    save_journal.replay_cells(game_map.tile_layout.ravel(order="F"), records, "layout")
+    if records:
+        explored = game_map.explored.to_array()
+        save_journal.replay_cells(explored.ravel(order="F"), records, "explored")
+        game_map.explored = ChunkedLayer.from_array(explored, fill_value=False)
+    game_map.rebuild_derived_layers()
+    for entity in [player, *floor_entities]:
+        entity.parent = game_map
+        game_map.entities.add(entity)
+    engine.game_map = game_map
+
+    if filename is not None and save.version == FORMAT_VERSION:
+        engine.save_journal.resume(engine, filename, dict(zip(entities, keys)), journal_start, journal_end)
+    engine.update_fov()
+    return engine
@@ -2,27 +2,39 @@
 from __future__ import annotations
 
 import copy
+import functools
 import lzma
+import mmap
+import os
 import pickle
 import traceback
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
+import numpy as np
 import tcod
 
 import color
-from engine import Engine
-from game_map import GameWorld
-import entity_factories
 import input_handlers
-from procgen import generate_dungeon
+import save_slots
 
+# The game modules (and the entity prototypes they build) are imported on first use,
+# so that the main menu can be shown without them.
+if TYPE_CHECKING:
+    from engine import Engine
 
-# Load the background image and remove the alpha channel.
-background_image = tcod.image.load("menu_background.png")[:, :, :3]
+
+@functools.lru_cache(maxsize=None)
+def load_background_image() -> np.ndarray:
+    """Load the main menu background image, without its alpha channel, the first time it's needed."""
+    return tcod.image.load("menu_background.png")[:, :, :3]
 
 
 def new_game() -> Engine:
     """Return a brand new game session as an Engine instance."""
+    from engine import Engine
+    from game_map import GameWorld
+    import entity_factories
+
     # Todo change back
     map_width = 80      # 80
     map_height = 43     # 43
@@ -34,6 +46,9 @@ def new_game() -> Engine:
     player = copy.deepcopy(entity_factories.player)
 
     engine = Engine(player=player)
+    engine.save_path = save_slots.SaveSlots().new_slot_path()
+    # Old messages are spilled next to the save, so that the history stays browsable.
+    engine.message_log.archive_path = os.path.splitext(engine.save_path)[0] + ".log"
 
     engine.game_world = GameWorld(
         engine=engine,
@@ -67,19 +82,47 @@ def new_game() -> Engine:
 
 
 def load_game(filename: str) -> Engine:
-    """Load an Engine instance from a file."""
+    """Load an Engine instance from a file.
+
+    Saves from before the binary save format are pickled Engines, and are still read as such.
+    """
+    from engine import Engine
+    import savefile
+
     with open(filename, "rb") as f:
-        engine = pickle.loads(lzma.decompress(f.read()))
+        if savefile.is_save_file(f.read(len(savefile.MAGIC))):
+            # Mapped rather than read, so that only the sections loaded now are paged in.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                engine = savefile.load_engine(data, filename)
+        else:
+            f.seek(0)
+            with lzma.open(f) as decompressed:  # Unpickled as it's decompressed, rather than all at once.
+                engine = pickle.load(decompressed)
     assert isinstance(engine, Engine)
+    engine.save_path = filename  # Keep saving to the slot it was loaded from.
+    engine.game_world.prefetch_next_floor()
     return engine
 
 
 class MainMenu(input_handlers.BaseEventHandler):
     """Handle the main menu rendering and input."""
 
+    def __init__(self) -> None:
+        self.menu_console: Optional[tcod.Console] = None
+
     def on_render(self, console: tcod.Console) -> None:
-        """Render the main menu on a background image."""
-        console.draw_semigraphics(background_image, 0, 0)
+        """Render the main menu, which is only composed again when the console changes size."""
+        if self.menu_console is None or (self.menu_console.width, self.menu_console.height) != (
+            console.width, console.height,
+        ):
+            self.menu_console = tcod.Console(console.width, console.height, order="F")
+            self.compose(self.menu_console)
+        self.menu_console.blit(console)
+
+    @staticmethod
+    def compose(console: tcod.Console) -> None:
+        """Draw the main menu on a background image."""
+        console.draw_semigraphics(load_background_image(), 0, 0)
 
         console.print(
             console.width // 2,
@@ -98,7 +141,7 @@ class MainMenu(input_handlers.BaseEventHandler):
 
         menu_width = 24
         for i, text in enumerate(
-            ["N - Start a new adventure", "C - Continue last adventure", "Q - Quit"]
+            ["N - Start a new adventure", "C - Continue last adventure", "L - Load an adventure", "Q - Quit"]
         ):
             console.print(
                 console.width // 2,
@@ -116,14 +159,65 @@ class MainMenu(input_handlers.BaseEventHandler):
         if event.sym in (tcod.event.K_q, tcod.event.K_ESCAPE):
             raise SystemExit()
         elif event.sym == tcod.event.K_c:
-            try:
-                return input_handlers.MainGameEventHandler(load_game("savegame.sav"))
-            except FileNotFoundError:
+            slots = save_slots.SaveSlots().list()
+            if not slots:
                 return input_handlers.PopupMessage(self, "No saved game to load.")
-            except Exception as exc:
-                traceback.print_exc()  # Print to stderr.
-                return input_handlers.PopupMessage(self, f"Failed to load save:\n{exc}")
+            return load_slot(self, slots[0])  # The most recently saved game.
+        elif event.sym == tcod.event.K_l:
+            return LoadGameMenu(self)
         elif event.sym == tcod.event.K_n:
             return input_handlers.MainGameEventHandler(new_game())
 
         return None
+
+
+def load_slot(parent: input_handlers.BaseEventHandler, slot: save_slots.SlotInfo) -> input_handlers.BaseEventHandler:
+    """Load the game in `slot`, or return to `parent` with a popup if that fails."""
+    try:
+        return input_handlers.MainGameEventHandler(load_game(slot.path))
+    except FileNotFoundError:
+        return input_handlers.PopupMessage(parent, "No saved game to load.")
+    except Exception as exc:
+        traceback.print_exc()  # Print to stderr.
+        return input_handlers.PopupMessage(parent, f"Failed to load save:\n{exc}")
+
+
+class LoadGameMenu(input_handlers.BaseEventHandler):
+    """List the save slots, newest first, and load the one picked.
+
+    Only the headers of the saves are read, from the slot index, until a slot is picked.
+    """
+
+    def __init__(self, parent: MainMenu):
+        self.parent = parent
+        self.slots = save_slots.SaveSlots().list()[:26]
+
+    def on_render(self, console: tcod.Console) -> None:
+        self.parent.on_render(console)
+        lines = [f"({chr(ord('a') + i)}) {slot.describe()}" for i, slot in enumerate(self.slots)]
+        if not lines:
+            lines = ["(No saved games)"]
+        width = min(console.width, max(len(line) for line in lines) + 2)
+        height = len(lines) + 2
+        x = (console.width - width) // 2
+        y = max(0, (console.height - height) // 2)
+        console.draw_frame(
+            x=x,
+            y=y,
+            width=width,
+            height=height,
+            title="Load which adventure?",
+            clear=True,
+            fg=(255, 255, 255),
+            bg=(0, 0, 0),
+        )
+        for i, line in enumerate(lines):
+            console.print(x + 1, y + i + 1, line)
+
+    def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[input_handlers.BaseEventHandler]:
+        index = event.sym - tcod.event.K_a
+        if 0 <= index < len(self.slots):
+            return load_slot(self.parent, self.slots[index])
+        if event.sym == tcod.event.K_ESCAPE:
+            return self.parent
+        return None
@@ -0,0 +1,34 @@
+"""A timeline of the game's startup, printed by `main.py --profile-startup`.
+
+Import this module before anything else, so that its start time is taken before the other imports.
+"""
+import sys
+import time
+from typing import List, Set, Tuple
+
+START_TIME = time.perf_counter()
+
+_modules_seen: Set[str] = {name.partition(".")[0] for name in sys.modules}
+_marks: List[Tuple[str, float, List[str]]] = []
+
+
+def mark(label: str) -> None:
+    """Record that the step `label` has finished, along with the top level modules it imported."""
+    modules = {name.partition(".")[0] for name in list(sys.modules)}
+    new_modules = sorted(modules - _modules_seen)
+    _modules_seen.update(new_modules)
+    _marks.append((label, time.perf_counter(), new_modules))
+
+
+def print_timeline() -> None:
+    """Print each recorded step, with its time since startup and how long it took."""
+    print("Startup timeline:")
+    previous = START_TIME
+    for label, timestamp, new_modules in _marks:
+        print(
+            f"{(timestamp - START_TIME) * 1000:9.1f} ms"
+            f" (+{(timestamp - previous) * 1000:7.1f} ms)  {label}"
+        )
+        if new_modules:
+            print(f"{'':25}imported: {', '.join(new_modules)}")
+        previous = timestamp
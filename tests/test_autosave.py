@@ -0,0 +1,73 @@
+"""Autosaves written in the background."""
+import random
+
+import numpy as np
+import pytest
+
+import autosave
+import entity_factories
+import savefile
+import setup_game
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    random.seed(1)
+    return setup_game.new_game()
+
+
+def fail(*args, **kwargs):
+    raise OSError("disk full")
+
+
+def change_floor(engine):
+    """Dig a tile and spawn an orc, returning where the orc is."""
+    game_map = engine.game_map
+    game_map.dig(1, 1)
+    x, y = (int(i) for i in np.argwhere(game_map.tile_layout == 0)[10])
+    entity_factories.orc.spawn(game_map, x, y)
+    return x, y
+
+
+def test_failed_autosave_is_raised_once():
+    autosaver = autosave.Autosaver()
+    autosaver.pending = autosaver.executor.submit(fail)
+    with pytest.raises(OSError):
+        autosaver.wait()
+    autosaver.close()
+
+
+def assert_saved_changes(engine, orc):
+    loaded = setup_game.load_game(engine.save_path)
+    assert loaded.game_map.tile_layout[1, 1] == 0
+    assert ("Orc", *orc) in [(e.name, e.x, e.y) for e in loaded.game_map.entities]
+
+
+def test_save_after_a_failed_journal_record_keeps_its_changes(engine, monkeypatch):
+    engine.save_as(engine.save_path)
+    orc = change_floor(engine)
+    autosaver = autosave.Autosaver()
+    with monkeypatch.context() as patch:
+        patch.setattr(savefile.zlib, "compress", fail)
+        autosaver.start(engine)
+        with pytest.raises(OSError):
+            autosaver.wait()
+    autosaver.close()
+
+    engine.save_as(engine.save_path)  # The save on exit.
+    assert_saved_changes(engine, orc)
+
+
+def test_save_after_a_failed_first_checkpoint_keeps_the_game(engine, monkeypatch):
+    orc = change_floor(engine)
+    autosaver = autosave.Autosaver()
+    with monkeypatch.context() as patch:
+        patch.setattr(savefile, "write_save", fail)
+        autosaver.start(engine)
+        with pytest.raises(OSError):
+            autosaver.wait()
+    autosaver.close()
+
+    engine.save_as(engine.save_path)
+    assert_saved_changes(engine, orc)
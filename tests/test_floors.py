@@ -0,0 +1,82 @@
+"""Floors packed as the seed they were generated from and their changes."""
+import random
+
+import numpy as np
+import pytest
+
+import entity_factories
+import procgen
+import savefile
+import setup_game
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    random.seed(1)
+    return setup_game.new_game()
+
+
+def test_packed_floor_keeps_its_changes(engine):
+    game_map = engine.game_map
+    assert game_map.generation is not None
+    game_map.dig(1, 1)
+    x, y = np.argwhere(game_map.tile_layout == 0)[10]
+    entity_factories.orc.spawn(game_map, int(x), int(y))
+    game_map.explored[:10, :10] = True
+
+    packed = savefile.pack_floor(game_map, engine)
+    assert "layout" not in savefile.SaveReader(packed)
+    unpacked = savefile.unpack_floor(packed, engine)
+    assert np.array_equal(unpacked.tile_layout, game_map.tile_layout)
+    assert np.array_equal(unpacked.explored.to_array(), game_map.explored.to_array())
+    assert unpacked.downstairs_location == game_map.downstairs_location
+    assert [(e.name, e.x, e.y) for e in unpacked.entities] == [("Orc", x, y)]
+
+
+def change_generator(monkeypatch):
+    """Make procgen generate every layout with one cell flipped, as a changed generator would."""
+    generate_layout = procgen.generate_layout
+
+    def changed_generator(**generation):
+        layout = generate_layout(**generation)
+        layout.tile_layout[1, 1] = 1 - layout.tile_layout[1, 1]
+        return layout
+
+    monkeypatch.setattr(procgen, "generate_layout", changed_generator)
+
+
+def test_floor_generated_differently_fails_to_unpack(engine, monkeypatch):
+    packed = savefile.pack_floor(engine.game_map, engine)
+    change_generator(monkeypatch)
+    with pytest.raises(savefile.SaveFormatError):
+        savefile.unpack_floor(packed, engine)
+
+
+def test_current_floor_loads_after_the_generator_changed(engine, monkeypatch):
+    data = savefile.save_engine(engine)
+    change_generator(monkeypatch)
+    loaded = savefile.load_engine(data)
+    assert np.array_equal(loaded.game_map.tile_layout, engine.game_map.tile_layout)
+
+
+def test_floor_which_fails_to_unpack_stays_cached(engine, monkeypatch):
+    floors = engine.game_world.floors
+    floors.add_packed(2, savefile.pack_floor(engine.game_map, engine))
+    change_generator(monkeypatch)
+    with pytest.raises(savefile.SaveFormatError):
+        floors.take(2)
+    assert 2 in floors
+
+
+def test_floor_snapshot_packs_the_floor_as_it_was_taken(engine):
+    game_map = engine.game_map
+    layout = game_map.tile_layout.copy()
+    explored = game_map.explored.to_array()
+    pack = savefile.snapshot_floor(game_map, engine)
+    game_map.dig(1, 1)
+    game_map.explored[:, :] = True
+
+    unpacked = savefile.unpack_floor(pack(), engine)
+    assert np.array_equal(unpacked.tile_layout, layout)
+    assert np.array_equal(unpacked.explored.to_array(), explored)
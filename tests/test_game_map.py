@@ -0,0 +1,23 @@
+"""Drawing the tiles of a GameMap."""
+import random
+
+import tcod
+
+import actions
+import setup_game
+import tile_types
+
+
+def test_stairs_keep_their_glyphs_once_drawn(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    random.seed(1)
+    engine = setup_game.new_game()
+    engine.player.place(*engine.game_map.downstairs_location, engine.game_map)
+    actions.TakeStairsAction(engine.player).perform()
+    game_map = engine.game_map
+    assert game_map.upstairs_location is not None
+
+    game_map.update_tile_graphics((slice(0, game_map.width), slice(0, game_map.height)))
+    engine.render(tcod.Console(80, 50, order="F"))
+    assert game_map.tiles[game_map.downstairs_location] == tile_types.down_stairs
+    assert game_map.tiles[game_map.upstairs_location] == tile_types.up_stairs
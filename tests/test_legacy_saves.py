@@ -0,0 +1,76 @@
+"""Saves made before the binary save format, which were pickled Engines."""
+import lzma
+import os
+import pickle
+
+import numpy as np
+
+# Made by the original version of the game: a new game with an orc, a potion on the floor, a
+# potion carried by the player, the player at 21 HP and five extra messages.
+BASELINE_SAVE = os.path.join(os.path.dirname(__file__), "data", "baseline_savegame.sav")
+
+
+def unpickle_baseline():
+    with open(BASELINE_SAVE, "rb") as f:
+        return pickle.loads(lzma.decompress(f.read()))
+
+
+def test_baseline_game_map_unpickles():
+    game_map = unpickle_baseline().game_map
+    assert game_map.tile_layout.dtype == np.uint8
+    assert game_map.tile_layout.flags.f_contiguous
+    assert (game_map.tile_layout == 0).any()
+    assert game_map.explored.to_array().any()
+    game_map.update_tile_graphics((slice(0, game_map.width), slice(0, game_map.height)))
+    assert game_map.tiles.to_array()["walkable"][game_map.tile_layout == 0].all()
+    assert game_map.upstairs_location is None
+
+
+def test_baseline_save_loads_renders_and_saves_again(tmp_path):
+    import shutil
+
+    import tcod
+
+    import setup_game
+
+    filename = str(tmp_path / "savegame.sav")
+    shutil.copy(BASELINE_SAVE, filename)
+    engine = setup_game.load_game(filename)
+    console = tcod.Console(80, 50, order="F")
+    engine.render(console)
+    engine.message_log.add_message("A message after loading.")
+    assert engine.turn_count == 0
+
+    resaved = str(tmp_path / "resaved.sav")
+    engine.save_as(resaved)
+    loaded = setup_game.load_game(resaved)
+    loaded.render(console)
+    assert loaded.player.fighter.hp == 21
+    assert [item.name for item in loaded.player.inventory.items] == [
+        item.name for item in engine.player.inventory.items
+    ]
+    assert loaded.player.inventory.items[-1].name == "Health Potion"
+    assert [m.plain_text for m in loaded.message_log.messages][-2:] == ["Baseline message 4.", "A message after loading."]
+    assert sorted(entity.name for entity in loaded.game_map.entities) == sorted(
+        entity.name for entity in engine.game_map.entities
+    )
+
+
+def test_continue_loads_the_legacy_save_slot(tmp_path, monkeypatch):
+    import shutil
+
+    import input_handlers
+    import save_slots
+    import setup_game
+
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(BASELINE_SAVE, save_slots.LEGACY_SAVE)
+    menu = setup_game.MainMenu()
+    slots = save_slots.SaveSlots().list()
+    assert [slot.path for slot in slots] == [save_slots.LEGACY_SAVE]
+    assert "an older save" in slots[0].describe()
+
+    handler = setup_game.load_slot(menu, slots[0])
+    assert isinstance(handler, input_handlers.MainGameEventHandler)
+    handler.engine.save_as(handler.engine.save_path)  # Saved back to its slot, in the current format.
+    assert save_slots.SaveSlots().list()[0].header["hp"] == 21
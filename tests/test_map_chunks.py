@@ -0,0 +1,49 @@
+"""The chunked layers of a GameMap."""
+import numpy as np
+import pytest
+
+import floor_cache
+from game_map import GameMap
+from map_chunks import CHUNK_SIZE, ChunkedLayer
+import tile_types
+
+
+def test_chunked_layer_reads_and_writes_like_an_array():
+    array = np.random.default_rng(1).random((70, 45)) > 0.7
+    layer = ChunkedLayer.from_array(array, fill_value=False)
+    assert np.array_equal(layer.to_array(), array)
+    assert np.array_equal(layer[5:40, 3:44], array[5:40, 3:44])
+    assert np.array_equal(layer[5, :], array[5, :])
+    assert layer[69, 44] == array[69, 44]
+
+    layer[10:20, 10:20] |= True
+    array[10:20, 10:20] |= True
+    layer[:, 4] = True
+    array[:, 4] = True
+    assert np.array_equal(layer.to_array(), array)
+    with pytest.raises(IndexError):
+        layer[70, 0]
+
+
+def test_chunks_holding_only_the_fill_value_are_not_allocated():
+    layer = ChunkedLayer((100, 100), bool, fill_value=False)
+    layer[:, :] = False
+    assert layer.nbytes == 0
+    layer[40, 40] = True
+    assert list(layer.chunks) == [(40 // CHUNK_SIZE, 40 // CHUNK_SIZE)]
+
+    mask = np.zeros((100, 100), dtype=bool)
+    mask[90, 5] = True
+    layer.set_where((slice(0, 100), slice(0, 100)), mask, True)
+    assert sorted(layer.chunks) == [(1, 1), (2, 0)]
+    assert layer[90, 5] and layer[40, 40] and layer.to_array().sum() == 2
+
+
+def test_solid_rock_costs_no_tiles():
+    game_map = GameMap(None, 2000, 2000)
+    game_map.update_explorable()
+    game_map.update_tile_graphics((slice(0, 200), slice(0, 200)))
+    assert game_map.tiles.nbytes == game_map.explored.nbytes == game_map.explorable.nbytes == 0
+    assert game_map.tiles[100, 100] == tile_types.pillar
+    # Only the layout and the visible cells take a byte per cell.
+    assert floor_cache.live_floor_bytes(game_map) == 2 * 2000 * 2000
@@ -0,0 +1,106 @@
+"""Saves appended to a save file as a journal of changes."""
+import os
+import random
+
+import numpy as np
+import pytest
+
+import actions
+import entity_factories
+import setup_game
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    random.seed(1)
+    return setup_game.new_game()
+
+
+def play_turn(engine, turn):
+    """Change a little of everything a journal record holds."""
+    game_map = engine.game_map
+    engine.turn_count += 1
+    game_map.dig(1 + turn, 1)
+    game_map.explored[turn, :] = True
+    engine.player.fighter.hp = 20 + turn % 5
+    engine.message_log.add_message(f"Turn {turn}")
+    x, y = np.argwhere(game_map.tile_layout == 0)[turn]
+    entity_factories.orc.spawn(game_map, int(x), int(y))
+
+
+def game_state(engine):
+    game_map = engine.game_map
+    return (
+        engine.turn_count,
+        engine.player.fighter.hp,
+        (engine.player.x, engine.player.y),
+        [item.name for item in engine.player.inventory.items],
+        sorted((entity.name, entity.x, entity.y) for entity in game_map.entities),
+        game_map.tile_layout.tobytes(),
+        game_map.explored.to_array().tobytes(),
+        [message.plain_text for message in engine.message_log.messages][-5:],
+    )
+
+
+def test_records_replay_over_the_checkpoint(engine):
+    journal = engine.save_journal
+    journal.compact_ratio = 10.0  # Keep appending records, the checkpoint of a new game is small.
+    engine.save_as(engine.save_path)
+    for turn in range(6):
+        play_turn(engine, turn)
+        engine.save_as(engine.save_path)
+    assert journal.end > journal.checkpoint_size  # Saved as records, not as new checkpoints.
+
+    assert game_state(setup_game.load_game(engine.save_path)) == game_state(engine)
+
+
+def test_truncated_final_record_is_dropped(engine):
+    engine.save_as(engine.save_path)
+    play_turn(engine, 0)
+    engine.save_as(engine.save_path)
+    saved = game_state(engine)
+    play_turn(engine, 1)
+    engine.save_as(engine.save_path)
+    with open(engine.save_path, "r+b") as f:
+        f.truncate(os.path.getsize(engine.save_path) - 10)  # As if the game crashed while writing it.
+
+    loaded = setup_game.load_game(engine.save_path)
+    assert game_state(loaded) == saved
+
+    # The next save goes over the broken record.
+    play_turn(loaded, 2)
+    loaded.save_as(loaded.save_path)
+    assert game_state(setup_game.load_game(loaded.save_path)) == game_state(loaded)
+
+
+def test_item_picked_up_again_keeps_its_inventory_order(engine):
+    player = engine.player
+    engine.save_as(engine.save_path)
+    first = player.inventory.items[0]
+    assert len(player.inventory.items) > 1
+    player.inventory.drop(first)
+    engine.save_as(engine.save_path)
+    actions.PickupAction(player).perform()
+    engine.save_as(engine.save_path)
+    assert player.inventory.items[-1] is first  # Now after the items which had later keys.
+
+    loaded = setup_game.load_game(engine.save_path)
+    assert game_state(loaded) == game_state(engine)
+
+
+def test_journal_is_compacted_into_a_new_checkpoint(engine):
+    engine.save_as(engine.save_path)
+    journal = engine.save_journal
+    first_checkpoint = journal.checkpoint_size
+    for turn in range(60):
+        play_turn(engine, turn)
+        engine.save_as(engine.save_path)
+        if journal.end == journal.checkpoint_size and turn:
+            break
+    else:
+        pytest.fail("The journal never grew past the compaction ratio.")
+    assert journal.checkpoint_size != first_checkpoint
+    assert os.path.getsize(engine.save_path) == journal.checkpoint_size  # The journal was dropped.
+
+    assert game_state(setup_game.load_game(engine.save_path)) == game_state(engine)
@@ -1,3 +1,4 @@
+import functools
 from typing import Tuple
 from engine import Engine
 import numpy as np  # type: ignore
@@ -49,6 +50,12 @@ down_stairs = new_tile(
     dark=(ord(">"), (0, 0, 100), (50, 50, 150)),
     light=(ord(">"), (255, 255, 255), (200, 180, 50)),
 )
+up_stairs = new_tile(
+    walkable=True,
+    transparent=True,
+    dark=(ord("<"), (0, 0, 100), (50, 50, 150)),
+    light=(ord("<"), (255, 255, 255), (200, 180, 50)),
+)
 
 wall = new_tile(
     walkable=False,
@@ -65,6 +72,7 @@ test_tile = new_tile(
 )
 
 
+@functools.lru_cache(maxsize=None)
 def new_wall(char: str = None) -> tile_dt:
     if char is None:
         return wall
@@ -76,3 +84,8 @@ def new_wall(char: str = None) -> tile_dt:
             light=(ord(char), (142, 134, 223), (15, 10, 30)),
         )
         return w
+
+
+# A wall with no walls next to it which the player could see. Drawn for all of a map's solid rock,
+# so it's what a map's tiles hold where nothing else has been drawn.
+pillar = new_wall("○")
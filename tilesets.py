@@ -0,0 +1,101 @@
+"""Load the bundled tilesets through a cache of decoded glyphs, and switch between them."""
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Dict, List, NamedTuple
+
+import numpy as np  # type: ignore
+import tcod
+
+CACHE_DIR = ".tileset_cache"
+
+
+class TileSheet(NamedTuple):
+    path: str
+    columns: int
+    rows: int
+    charmap_name: str  # Name of a tcod.tileset.CHARMAP_* constant.
+
+    @property
+    def charmap(self) -> List[int]:
+        return getattr(tcod.tileset, f"CHARMAP_{self.charmap_name}")
+
+
+# The tile sheets shipped with the game, the first one is the default.
+TILE_SHEETS = [
+    TileSheet("Redjack17_edit.png", 16, 16, "CP437"),
+    TileSheet("Aesomatica-16x16.png", 16, 16, "CP437"),
+    TileSheet("Gold-plated-16x16-v2.png", 16, 16, "CP437"),
+    TileSheet("dejavu10x10_gs_tc.png", 32, 8, "TCOD"),
+]
+
+
+class TilesetManager:
+    """Loads tile sheets and keeps the loaded tilesets, so switching between them costs nothing.
+
+    The first time a sheet is used its glyphs are decoded from the PNG and written to a raw atlas in
+    `cache_dir`, keyed by the file's hash, its layout and its charmap. Later runs load that atlas
+    instead of decoding the image again.
+    """
+
+    def __init__(self, sheets: List[TileSheet] = TILE_SHEETS, cache_dir: str = CACHE_DIR):
+        self.sheets = sheets
+        self.cache_dir = cache_dir
+        self.current = 0  # Index of the active sheet in `sheets`.
+        self.tilesets: Dict[TileSheet, tcod.tileset.Tileset] = {}
+
+    @property
+    def tileset(self) -> tcod.tileset.Tileset:
+        """The tileset of the active sheet."""
+        return self.load(self.sheets[self.current])
+
+    def next_tileset(self) -> tcod.tileset.Tileset:
+        """Make the next bundled sheet active and return its tileset."""
+        self.current = (self.current + 1) % len(self.sheets)
+        return self.tileset
+
+    def load(self, sheet: TileSheet) -> tcod.tileset.Tileset:
+        """Return the tileset for `sheet`, from memory, then from the atlas cache, then from the image."""
+        if sheet not in self.tilesets:
+            with open(sheet.path, "rb") as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            atlas_path = os.path.join(
+                self.cache_dir,
+                f"{digest}-{sheet.columns}x{sheet.rows}-{sheet.charmap_name}.npy",
+            )
+            try:
+                self.tilesets[sheet] = self.load_atlas(atlas_path)
+            except (OSError, ValueError, KeyError):  # Missing or unreadable, so decode the image again.
+                tileset = tcod.tileset.load_tilesheet(
+                    sheet.path, sheet.columns, sheet.rows, sheet.charmap
+                )
+                self.save_atlas(atlas_path, tileset, sheet.charmap)
+                self.tilesets[sheet] = tileset
+        return self.tilesets[sheet]
+
+    @staticmethod
+    def load_atlas(path: str) -> tcod.tileset.Tileset:
+        """Build a tileset from a glyph atlas written by `save_atlas`."""
+        atlas = np.load(path)
+        tile_height, tile_width = atlas["glyph"].shape[1:3]
+        tileset = tcod.tileset.Tileset(tile_width, tile_height)
+        for codepoint, glyph in zip(atlas["codepoint"].tolist(), atlas["glyph"]):
+            tileset.set_tile(codepoint, glyph)
+        return tileset
+
+    @staticmethod
+    def save_atlas(path: str, tileset: tcod.tileset.Tileset, charmap: List[int]) -> None:
+        """Write the RGBA glyph of each codepoint in `charmap` to a raw atlas file."""
+        codepoints = sorted(set(charmap))
+        atlas = np.empty(
+            len(codepoints),
+            dtype=[("codepoint", np.int32), ("glyph", np.uint8, (*tileset.tile_shape, 4))],
+        )
+        atlas["codepoint"] = codepoints
+        atlas["glyph"] = [tileset.get_tile(codepoint) for codepoint in codepoints]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, atlas)
+        os.replace(temp_path, path)